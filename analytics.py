@@ -0,0 +1,114 @@
+import statistics
+import time
+from array import array
+from collections import Counter
+from typing import List, Dict
+
+from content_item import ContentItem
+from instrumentation import get_metrics
+
+TOP_SUBREDDITS = 10
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+_EPOCH_WEEKDAY = 3 # 1970-01-01 was a Thursday
+
+def _score_stats(scores: array) -> Dict | None:
+    if not scores:
+        return None
+    return {"count": len(scores), "mean": statistics.fmean(scores), "median": statistics.median(scores),
+            "min": min(scores), "max": max(scores), "negative_share": sum(1 for s in scores if s < 0) / len(scores)}
+
+def compute_activity_stats(user_content: List[ContentItem]) -> Dict:
+    """
+    Computes exact activity statistics for a user's comments and posts, without the LLM.
+
+    Timestamps and scores are gathered into typed arrays once and every statistic is derived
+    with integer arithmetic on them (hour = t // 3600 % 24, weekday from days since the epoch),
+    so no datetime objects are created per item. All times are UTC. The result contains no
+    values relative to the current time, so prompts built from it stay cacheable.
+
+    Args:
+        user_content (List[ContentItem]): The items; subreddit, score and created_utc may be unset.
+
+    Returns:
+        Dict: With keys 'comments' and 'posts' (counts), 'subreddits' (a list of (name, count),
+              most active first), 'first_utc', 'last_utc', 'span_days', 'items_per_week',
+              'median_gap_days', 'hours' (24 counts, UTC), 'weekdays' (7 counts, Monday first)
+              and 'comment_scores' / 'post_scores' (count, mean, median, min, max and
+              negative_share, or None).
+    """
+    with get_metrics().stage("activity_stats", items=len(user_content)):
+        timestamps = array("d", sorted(item.created_utc for item in user_content if item.created_utc))
+        comment_scores = array("q", (item.score or 0 for item in user_content if item.type == "comment"))
+        post_scores = array("q", (item.score or 0 for item in user_content if item.type == "post"))
+        subreddits = Counter(item.subreddit for item in user_content if item.subreddit)
+
+        stats = {"comments": len(comment_scores), "posts": len(post_scores),
+                 "subreddits": subreddits.most_common(), "first_utc": None, "last_utc": None, "span_days": 0.0,
+                 "items_per_week": None, "median_gap_days": None, "hours": [0] * 24, "weekdays": [0] * 7,
+                 "comment_scores": _score_stats(comment_scores), "post_scores": _score_stats(post_scores)}
+        if timestamps:
+            seconds = array("q", map(int, timestamps))
+            hours = Counter(t // 3600 % 24 for t in seconds)
+            weekdays = Counter((t // 86400 + _EPOCH_WEEKDAY) % 7 for t in seconds)
+            stats["hours"] = [hours[h] for h in range(24)]
+            stats["weekdays"] = [weekdays[d] for d in range(7)]
+            stats["first_utc"], stats["last_utc"] = timestamps[0], timestamps[-1]
+            stats["span_days"] = (timestamps[-1] - timestamps[0]) / 86400
+            if len(timestamps) > 1:
+                stats["items_per_week"] = len(timestamps) / max(stats["span_days"] / 7, 1 / 7)
+                stats["median_gap_days"] = statistics.median(
+                    b - a for a, b in zip(timestamps, timestamps[1:])) / 86400
+    return stats
+
+def _format_scores(label: str, scores: Dict | None) -> str | None:
+    if scores is None:
+        return None
+    return (f"{label}: median {scores['median']:g}, mean {scores['mean']:.1f}, range {scores['min']} to "
+            f"{scores['max']}, {scores['negative_share']:.0%} negative")
+
+def format_activity_block(stats: Dict) -> str:
+    """
+    Renders activity statistics as compact prompt lines for the "Online Behavior" section.
+
+    Returns:
+        str: The block, or an empty string if there is nothing to report.
+    """
+    total = stats["comments"] + stats["posts"]
+    if not total:
+        return ""
+    lines = [f"- Based on {stats['comments']} fetched comments and {stats['posts']} posts (times in UTC)."]
+    if stats["first_utc"] is not None:
+        first = time.strftime("%Y-%m-%d", time.gmtime(stats["first_utc"]))
+        last = time.strftime("%Y-%m-%d", time.gmtime(stats["last_utc"]))
+        cadence = f"- Active from {first} to {last} ({stats['span_days']:.0f} days)"
+        if stats["items_per_week"] is not None:
+            cadence += (f"; {stats['items_per_week']:.1f} items per week on average, "
+                        f"median gap between items {stats['median_gap_days']:.1f} days")
+        lines.append(cadence + ".")
+    if stats["subreddits"]:
+        named = sum(count for _, count in stats["subreddits"])
+        shares = ", ".join(f"r/{name} {count / named:.0%}" for name, count in stats["subreddits"][:TOP_SUBREDDITS])
+        more = len(stats["subreddits"]) - TOP_SUBREDDITS
+        lines.append(f"- Subreddits by share of items: {shares}" + (f", and {more} more." if more > 0 else "."))
+    if any(stats["hours"]):
+        lines.append(f"- Items per hour of day, 00 to 23: {' '.join(map(str, stats['hours']))}.")
+        lines.append("- Items per weekday: " + ", ".join(f"{day} {count}" for day, count in zip(WEEKDAYS, stats["weekdays"])) + ".")
+    for line in (_format_scores("- Comment scores", stats["comment_scores"]), _format_scores("- Post scores", stats["post_scores"])):
+        if line:
+            lines.append(line + ".")
+    return "\n".join(lines) + "\n"
+
+def build_activity_block(user_content: List[ContentItem]) -> str:
+    """
+    Computes and renders the activity statistics block for user_content.
+    """
+    return format_activity_block(compute_activity_stats(user_content))
+
+if __name__ == "__main__":
+    sample_content = [
+        ContentItem(type="comment", id="1", text="", url="", subreddit="Eldenring", score=12, created_utc=1700000000),
+        ContentItem(type="comment", id="2", text="", url="", subreddit="learnprogramming", score=-2, created_utc=1700090000),
+        ContentItem(type="comment", id="3", text="", url="", subreddit="Eldenring", score=3, created_utc=1700500000),
+        ContentItem(type="post", id="4", text="", url="", subreddit="scifi", score=40, created_utc=1701000000),
+    ]
+    print(build_activity_block(sample_content))
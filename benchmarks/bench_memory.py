@@ -0,0 +1,111 @@
+"""
+Memory benchmark for the in-memory representation of scraped items.
+
+Builds the same synthetic Reddit-like comments and posts in three representations and reports
+the memory each holds, measured with tracemalloc:
+
+- "dicts": the former pipeline, where get_user_content returned one dict per item and
+  prepare_user_content copied each into a second dict with the cleaned text.
+- "ContentItem": one slotted record per item, with the text cleaned in place.
+- "ContentBatch": the column-oriented container run_batch holds waiting users in.
+
+Usage:
+    python benchmarks/bench_memory.py [--items 1000000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_item import ContentItem, ContentBatch
+
+WORDS = ["the", "python", "really", "I'm", "game", "don't", "work", "today", "Reddit", "thanks!",
+         "lol", "honestly,", "wallet", "crypto", "deadline", "because", "anyone", "know", "why", "update"]
+SUBREDDITS = [f"subreddit_{n}" for n in range(300)]
+POST_SHARE = 0.1
+
+def make_fields(count: int, seed: int = 42):
+    """
+    Yields (type, id, title, text, url, subreddit, score, created_utc) tuples of freshly built strings.
+    """
+    rng = random.Random(seed)
+    for n in range(count):
+        is_post = rng.random() < POST_SHARE
+        item_id = f"{n:07x}"
+        subreddit = rng.choice(SUBREDDITS)
+        title = " ".join(rng.choices(WORDS, k=rng.randint(5, 12))) if is_post else ""
+        text = "  ".join(rng.choices(WORDS, k=rng.randint(10, 60)))
+        url = f"https://reddit.com/r/{subreddit}/comments/{item_id}/_/{n:x}/"
+        yield ("post" if is_post else "comment", item_id, title, text, url, subreddit,
+               rng.randint(-5, 500), 1.6e9 + rng.random() * 1e8)
+
+def clean(text: str) -> str:
+    return " ".join(text.split())
+
+def build_dicts(count: int) -> list:
+    scraped = []
+    prepared = []
+    for kind, item_id, title, text, url, subreddit, score, created_utc in make_fields(count):
+        item = {"type": kind, "id": item_id, "text": text, "url": url, "subreddit": subreddit, "score": score,
+                "created_utc": created_utc}
+        if kind == "post":
+            item["title"] = title
+        scraped.append(item)
+        copy = {"type": kind, "text": clean(text), "url": url, "subreddit": subreddit, "score": score,
+                "created_utc": created_utc}
+        if kind == "post":
+            copy["title"] = title
+        prepared.append(copy)
+    return [scraped, prepared] # Both lists stay alive until the persona is generated
+
+def build_items(count: int) -> list:
+    items = []
+    for kind, item_id, title, text, url, subreddit, score, created_utc in make_fields(count):
+        item = ContentItem(type=kind, id=item_id, text=text, url=url, subreddit=subreddit, score=score,
+                           created_utc=created_utc, title=title)
+        item.text = clean(item.text)
+        items.append(item)
+    return items
+
+def build_batch(count: int) -> ContentBatch:
+    batch = ContentBatch()
+    for kind, item_id, title, text, url, subreddit, score, created_utc in make_fields(count):
+        batch.append(ContentItem(type=kind, id=item_id, text=clean(text), url=url, subreddit=subreddit,
+                                 score=score, created_utc=created_utc, title=title))
+    return batch
+
+def measure(name: str, build, count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build(count)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14} {current / 1e6:>9.1f} {peak / 1e6:>9.1f} {current / count:>11.0f} {elapsed:>9.2f}")
+    if isinstance(held, ContentBatch):
+        start = time.perf_counter()
+        items = held.to_items()
+        print(f"  rebuilding {len(items)} ContentItems from the batch took {time.perf_counter() - start:.2f}s")
+    del held
+    return current
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000, help="Number of items (default: 1000000).")
+    args = parser.parse_args()
+
+    print(f"{args.items} items, {POST_SHARE:.0%} posts")
+    print(f"{'':<14} {'held MB':>9} {'peak MB':>9} {'bytes/item':>11} {'build s':>9}")
+    baseline = measure("dicts", build_dicts, args.items)
+    for name, build in [("ContentItem", build_items), ("ContentBatch", build_batch)]:
+        held = measure(name, build, args.items)
+        print(f"  {held / baseline:.0%} of the dicts' memory")
+
+if __name__ == "__main__":
+    main()
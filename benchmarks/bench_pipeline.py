@@ -0,0 +1,155 @@
+"""
+Offline end-to-end benchmark of the persona pipeline.
+
+Runs main.py's pipeline against FakeReddit and a local FakeOpenAIServer (see fakes.py), so no
+credentials or network access are needed. The "serial" mode drives the single-user path one
+user after another, as repeated `python main.py <url>` runs would; the "batch" mode drives
+main.run_batch. For each mode it reports users per minute, p50/p95 latency per stage and peak
+memory.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--users 40] [--mode both] [--llm-latency 0.5] ...
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from contextlib import redirect_stdout
+from io import StringIO
+from openai import OpenAI
+
+import main
+import pipeline
+from persona_generator import generate_persona
+from output_sink import OutputSink
+from rate_limiter import RateLimitScheduler, set_scheduler
+from fakes import FakeReddit, FakeOpenAIServer
+
+STAGES = ["scrape", "prepare", "generate", "save"]
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of values (fraction between 0 and 1).
+    """
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+def run_serial(usernames: list, reddit, openai_client: OpenAI, args, output_dir: str) -> list:
+    """
+    Processes users one at a time with the same steps as main.main's single-user path.
+    """
+    results = []
+    sink = OutputSink(output_dir)
+    for username in usernames:
+        timings = {}
+        start = time.perf_counter()
+        scraped_utc = time.time()
+        comments, posts = pipeline.fetch_user_content(reddit, username, limit=args.limit)
+        timings["scrape"] = time.perf_counter() - start
+        start = time.perf_counter()
+        all_user_content, activity_stats = pipeline.prepare_user_content(comments, posts)
+        timings["prepare"] = time.perf_counter() - start
+        start = time.perf_counter()
+        persona_content = generate_persona(None, all_user_content, username, client=openai_client,
+                                           activity_stats=activity_stats)
+        timings["generate"] = time.perf_counter() - start
+        start = time.perf_counter()
+        path = sink.write(username, persona_content, scraped_utc).result()
+        timings["save"] = time.perf_counter() - start
+        results.append({"username": username, "status": "ok" if path else "failed", "timings": timings})
+    sink.close()
+    return results
+
+def run_mode(mode: str, args) -> dict:
+    usernames = [f"bench_user_{i:05d}" for i in range(args.users)]
+    reddit = FakeReddit(items_per_user=args.items, body_chars=args.body_chars, page_latency=args.reddit_latency,
+                        requests_per_minute=args.reddit_rpm)
+    with FakeOpenAIServer(latency=args.llm_latency, completion_tokens=args.completion_tokens,
+                          tokens_per_second=args.llm_tps, requests_per_minute=args.llm_rpm) as server, \
+         tempfile.TemporaryDirectory() as output_dir:
+        if args.scheduler:
+            # Unset quotas are effectively unlimited; the scheduler then only retries
+            set_scheduler(RateLimitScheduler(reddit_rpm=args.reddit_rpm or 1e9, openai_rpm=args.llm_rpm or 1e9,
+                                             openai_tpm=1e12, base_delay=0.1))
+        openai_client = OpenAI(api_key="offline-benchmark", base_url=server.base_url,
+                               max_retries=0 if args.scheduler else 2)
+        if args.tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with redirect_stdout(StringIO()): # The pipeline's progress prints would swamp the report
+            if mode == "serial":
+                results = run_serial(usernames, reddit, openai_client, args, output_dir)
+            else:
+                results = main.run_batch(usernames, reddit, openai_client, limit=args.limit,
+                                         scrape_workers=args.scrape_workers, generate_workers=args.generate_workers,
+                                         output_dir=output_dir, stream=args.stream, map_reduce=args.map_reduce)
+        elapsed = time.perf_counter() - start
+        set_scheduler(None)
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+        return {"mode": mode, "elapsed": elapsed, "results": results, "traced_peak": traced_peak,
+                "reddit_requests": reddit.request_count, "llm_requests": server.request_count,
+                "llm_rate_limited": server.rate_limited_count}
+
+def print_report(run: dict) -> None:
+    results = run["results"]
+    ok = sum(1 for result in results if result["status"] == "ok")
+    print(f"\n=== {run['mode']} ===")
+    print(f"users: {len(results)} ({ok} ok), wall time {run['elapsed']:.2f}s, "
+          f"{len(results) / run['elapsed'] * 60:.1f} users/min")
+    print(f"reddit requests: {run['reddit_requests']}, llm requests: {run['llm_requests']} "
+          f"({run['llm_rate_limited']} rate-limited)")
+    print(f"{'stage':<10}{'p50 (s)':>10}{'p95 (s)':>10}")
+    for stage in STAGES:
+        values = [result["timings"][stage] for result in results if stage in result.get("timings", {})]
+        if values:
+            print(f"{stage:<10}{percentile(values, 0.5):>10.3f}{percentile(values, 0.95):>10.3f}")
+    if run["traced_peak"] is not None:
+        print(f"peak traced Python memory: {run['traced_peak'] / 1e6:.1f} MB")
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40, help="Number of users to profile (default: 40).")
+    parser.add_argument("--mode", choices=["serial", "batch", "both"], default="both")
+    parser.add_argument("--scrape-workers", type=int, default=4)
+    parser.add_argument("--generate-workers", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=200, help="Comments and posts fetched per user (default: 200).")
+    parser.add_argument("--items", type=int, default=200, help="Comments and posts each fake user has (default: 200).")
+    parser.add_argument("--body-chars", type=int, default=300, help="Characters per fake comment/post (default: 300).")
+    parser.add_argument("--reddit-latency", type=float, default=0.05, help="Seconds per Reddit listing page (default: 0.05).")
+    parser.add_argument("--reddit-rpm", type=float, help="Reddit requests per minute quota (default: unlimited).")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the first LLM token (default: 0.5).")
+    parser.add_argument("--llm-tps", type=float, help="LLM completion tokens per second (default: instant).")
+    parser.add_argument("--llm-rpm", type=int, help="LLM requests per minute quota (default: unlimited).")
+    parser.add_argument("--completion-tokens", type=int, default=600, help="Tokens per fake completion (default: 600).")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming path in batch mode.")
+    parser.add_argument("--map-reduce", action="store_true", help="Use map-reduce generation in batch mode.")
+    parser.add_argument("--scheduler", action="store_true",
+                        help="Route calls through the shared rate-limit scheduler, paced to the quotas above.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report peak traced Python memory (slower).")
+    args = parser.parse_args()
+
+    modes = ["serial", "batch"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        print_report(run_mode(mode, args))
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1e6 if sys.platform == "darwin" else 1e3
+        print(f"\npeak process RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale:.1f} MB")
+
+if __name__ == "__main__":
+    main_benchmark()
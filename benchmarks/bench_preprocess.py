@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for the text preprocessing functions in utils.
+
+Compares the original per-string implementation of preprocess_text (lowercase plus three
+inline re.sub passes) with the batch API on a synthetic corpus of Reddit-like comments,
+and checks that both produce identical output.
+
+Usage:
+    python benchmarks/bench_preprocess.py [--comments 100000] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import preprocess_text, preprocess_texts
+
+WORDS = ["the", "python", "really", "I'm", "game", "don't", "work", "today", "Reddit", "thanks!",
+         "lol", "honestly,", "wallet", "(edit)", "crypto", "café", "deadline", "100%", "&amp;", "why?"]
+DECORATIONS = ["", "", "**", "> ", "# ", "~~", "[link](https://example.com/path_{n})", "https://reddit.com/r/x/{n}",
+               "www.example.org/{n}", "&#x200B;\n\n", "\n\n---\n", "naïve\u00a0Ünïcode\u3000🎉"]
+
+def legacy_preprocess_text(text: str) -> str:
+    """
+    The original implementation of utils.preprocess_text, kept here as the baseline.
+    """
+    if not isinstance(text, str):
+        return ""
+    text = text.lower()
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)
+    text = re.sub(r'[^a-z0-9\s]', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def make_corpus(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(count):
+        words = rng.choices(WORDS, k=rng.randint(5, 60))
+        decoration = rng.choice(DECORATIONS).format(n=n)
+        words.insert(rng.randint(0, len(words)), decoration)
+        corpus.append("  ".join(words) if n % 7 == 0 else " ".join(words))
+    return corpus
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, default=100_000, help="Corpus size (default: 100000).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant; the best is reported (default: 3).")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.comments)
+    total_mb = sum(len(text) for text in corpus) / 1e6
+    print(f"Corpus: {len(corpus)} comments, {total_mb:.1f} MB of text")
+
+    expected = [legacy_preprocess_text(text) for text in corpus]
+    assert [preprocess_text(text) for text in corpus] == expected, "preprocess_text output changed"
+    assert preprocess_texts(corpus) == expected, "preprocess_texts output differs from preprocess_text"
+
+    variants = [
+        ("legacy preprocess_text (per string)", lambda: [legacy_preprocess_text(text) for text in corpus]),
+        ("preprocess_text (per string)", lambda: [preprocess_text(text) for text in corpus]),
+        ("preprocess_texts (batch)", lambda: preprocess_texts(corpus)),
+        ("preprocess_texts (batch, keep_context)", lambda: preprocess_texts(corpus, keep_context=True)),
+    ]
+    baseline = None
+    for name, func in variants:
+        seconds = best_of(args.repeat, func)
+        baseline = baseline or seconds
+        print(f"{name:<40} {seconds:7.3f}s  {len(corpus) / seconds:>10,.0f} comments/s  {baseline / seconds:5.2f}x")
+
+if __name__ == "__main__":
+    main()
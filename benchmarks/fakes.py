@@ -0,0 +1,266 @@
+"""
+Local stand-ins for Reddit and OpenAI used by the offline benchmarks.
+
+FakeReddit implements the subset of the PRAW API the scraper uses (redditor(), the comments and
+submissions listings with top() and new(), and the item attributes it reads). FakeOpenAIServer is
+a local HTTP server speaking the OpenAI chat completions protocol, so the real openai client can
+be pointed at it with base_url. Both support configurable latency, rate limits and payload sizes.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_SIZE = 100 # Items per Reddit listing request, as with PRAW
+SUBREDDITS = ["AskReddit", "python", "gaming", "solana", "learnprogramming", "books", "jobs", "movies"]
+WORDS = ["I", "think", "the", "new", "update", "really", "works", "for", "me", "but", "honestly", "my",
+         "job", "keeps", "me", "busy", "so", "weekends", "are", "for", "games", "and", "reading", "lol"]
+
+class FakeRedditNotFound(Exception):
+    """
+    Raised for users configured as missing, like PRAW raises for unknown redditors.
+    """
+
+class FakeSubreddit:
+    def __init__(self, display_name: str):
+        self.display_name = display_name
+
+    def __str__(self) -> str:
+        return self.display_name
+
+class FakeItem:
+    """
+    A comment or submission with the attributes reddit_scraper reads.
+    """
+
+    def __init__(self, kind: str, username: str, index: int, rng: random.Random, body_chars: int, now: float):
+        self.id = f"{kind[0]}{zlib.crc32(username.encode()):x}{index}"
+        self.subreddit = FakeSubreddit(rng.choice(SUBREDDITS))
+        self.permalink = f"/r/{self.subreddit}/comments/{self.id}/"
+        self.score = int(rng.paretovariate(1.2)) - 1
+        self.created_utc = now - rng.uniform(0, 3 * 365 * 86400)
+        text = " ".join(rng.choices(WORDS, k=max(1, body_chars // 5)))[:body_chars]
+        if kind == "comment":
+            self.body = text
+        else:
+            self.title = text[:80]
+            self.selftext = text if index % 3 else "" # Some link posts without a body
+
+class FakeListing:
+    def __init__(self, reddit: "FakeReddit", username: str, kind: str):
+        self._reddit = reddit
+        self._username = username
+        self._kind = kind
+
+    def _items(self):
+        rng = random.Random(zlib.crc32(f"{self._username}/{self._kind}".encode()))
+        return [FakeItem(self._kind, self._username, i, rng, self._reddit.body_chars, self._reddit.now)
+                for i in range(self._reddit.items_per_user)]
+
+    def _paginate(self, items, limit):
+        limit = len(items) if limit is None else min(limit, len(items))
+        for start in range(0, limit, PAGE_SIZE):
+            self._reddit.request()
+            yield from items[start:min(start + PAGE_SIZE, limit)]
+
+    def top(self, time_filter: str = "all", limit: int | None = 100):
+        return self._paginate(sorted(self._items(), key=lambda item: item.score, reverse=True), limit)
+
+    def new(self, limit: int | None = 100):
+        return self._paginate(sorted(self._items(), key=lambda item: item.created_utc, reverse=True), limit)
+
+class FakeRedditor:
+    def __init__(self, reddit: "FakeReddit", name: str):
+        self.name = name
+        self.comments = FakeListing(reddit, name, "comment")
+        self.submissions = FakeListing(reddit, name, "post")
+
+class FakeReddit:
+    """
+    A PRAW-compatible Reddit stand-in generating deterministic content per username.
+
+    Each listing page costs one simulated request, which waits page_latency seconds. With
+    requests_per_minute set, requests are spaced out the way PRAW's own rate limiter does it.
+    """
+
+    def __init__(self, items_per_user: int = 200, body_chars: int = 300, page_latency: float = 0.05,
+                 requests_per_minute: float | None = None, missing_users: tuple = ()):
+        self.items_per_user = items_per_user
+        self.body_chars = body_chars
+        self.page_latency = page_latency
+        self.requests_per_minute = requests_per_minute
+        self.missing_users = set(missing_users)
+        self.now = time.time()
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+            if self.requests_per_minute:
+                now = time.monotonic()
+                wait = self._next_slot - now
+                self._next_slot = max(now, self._next_slot) + 60 / self.requests_per_minute
+            else:
+                wait = 0
+        time.sleep(max(0, wait) + self.page_latency)
+
+    def redditor(self, name: str) -> FakeRedditor:
+        if name in self.missing_users:
+            raise FakeRedditNotFound(f"received 404 HTTP response for u/{name}")
+        return FakeRedditor(self, name)
+
+def _persona_text(username: str, words: int) -> str:
+    sections = ["Demographics", "Behavior & Habits", "Frustrations", "Goals & Needs",
+                "Motivations", "Personality Traits", "Online Behavior", "Quote"]
+    per_section = max(1, words // len(sections))
+    rng = random.Random(username)
+    body = "".join(f"**{section}:**\n- {' '.join(rng.choices(WORDS, k=per_section))} "
+                   f"(Citation: https://reddit.com/r/python/comments/x{i}/)\n\n"
+                   for i, section in enumerate(sections))
+    return f"### User Persona: {username}\n\n{body}"
+
+class FakeOpenAIServer:
+    """
+    A local OpenAI-compatible chat completions server.
+
+    Responses take latency seconds plus completion_tokens / tokens_per_second (if set); streamed
+    responses spread that time over their chunks. With requests_per_minute set, requests beyond
+    the quota within a one-minute window get HTTP 429 with Retry-After and x-ratelimit headers.
+    Use as a context manager and point the client at base_url.
+    """
+
+    def __init__(self, latency: float = 0.5, completion_tokens: int = 600, tokens_per_second: float | None = None,
+                 requests_per_minute: int | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+        self.tokens_per_second = tokens_per_second
+        self.requests_per_minute = requests_per_minute
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _admit(self) -> tuple:
+        """
+        Counts a request against the quota. Returns (allowed, remaining, seconds_until_reset).
+        """
+        with self._lock:
+            self.request_count += 1
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._window_count = now, 0
+            reset = 60 - (now - self._window_start)
+            if self.requests_per_minute and self._window_count >= self.requests_per_minute:
+                self.rate_limited_count += 1
+                return False, 0, reset
+            self._window_count += 1
+            remaining = self.requests_per_minute - self._window_count if self.requests_per_minute else 10000
+            return True, remaining, reset
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}}, {})
+                    return
+
+                allowed, remaining, reset = server._admit()
+                headers = {"x-ratelimit-limit-requests": str(server.requests_per_minute or 10000),
+                           "x-ratelimit-remaining-requests": str(remaining),
+                           "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+                if not allowed:
+                    headers["retry-after"] = f"{reset:.3f}"
+                    self._send_json(429, {"error": {"message": "Rate limit reached for requests",
+                                                    "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+                    return
+
+                prompt = "".join(message.get("content", "") for message in request.get("messages", []))
+                match = prompt.split("### User Persona: ", 1)
+                username = match[1].split("\n", 1)[0] if len(match) > 1 else "user"
+                if request.get("response_format", {}).get("type") == "json_object":
+                    content = json.dumps({"findings": [
+                        {"section": "Behavior & Habits", "finding": "Posts about games on weekends",
+                         "citation": "https://reddit.com/r/gaming/comments/x1/"}]})
+                else:
+                    content = _persona_text(username, server.completion_tokens)
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": server.completion_tokens,
+                         "total_tokens": len(prompt) // 4 + server.completion_tokens}
+                generation_time = server.latency
+                if server.tokens_per_second:
+                    generation_time += server.completion_tokens / server.tokens_per_second
+                base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+
+                if not request.get("stream"):
+                    time.sleep(generation_time)
+                    self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]},
+                        headers)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+                time.sleep(server.latency)
+                for piece in pieces:
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep((generation_time - server.latency) / len(pieces))
+                final = {**base, "object": "chat.completion.chunk", "usage": usage,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
@@ -0,0 +1,130 @@
+import math
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple
+
+@dataclass(slots=True)
+class ContentItem:
+    """
+    A scraped Reddit comment or post, as it moves through the whole pipeline.
+
+    Items are created once by the scraper (or the content store) and then updated in place:
+    prepare_user_content replaces the text with its cleaned form, and dedup_items sets urls
+    on the items that absorbed duplicates. With slots, an item costs a fixed ~100 bytes
+    plus its strings, instead of a dict with its own copy of every key.
+    """
+    type: str # "comment" or "post"
+    id: str
+    text: str # Comment body or post selftext; may be empty for link posts
+    url: str # Permalink, used for citations
+    subreddit: str | None = None
+    score: int = 0
+    created_utc: float | None = None
+    title: str = "" # Posts only
+    urls: Tuple[str, ...] = () # Own URL first, then those of absorbed duplicates; empty if none
+
+class _StringColumn:
+    """
+    Strings stored back to back as UTF-8 in one bytearray, with an array of their end offsets.
+    """
+    __slots__ = ("data", "ends")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array("Q")
+
+    def append(self, value: str) -> None:
+        self.data += value.encode("utf-8", "surrogatepass")
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, index: int) -> str:
+        start = self.ends[index - 1] if index else 0
+        return self.data[start:self.ends[index]].decode("utf-8", "surrogatepass")
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.ends.itemsize * len(self.ends)
+
+class ContentBatch:
+    """
+    A compact, column-oriented container for many ContentItems, e.g. a cohort of users' content.
+
+    Numbers are kept in typed arrays, strings back to back in one buffer per field, and
+    subreddit names once each, so a held item costs its UTF-8 bytes plus a few dozen bytes of
+    offsets instead of one Python object per field. Items are rebuilt as ContentItems on access,
+    so a batch suits content that is held for a while and then read once (see run_batch).
+    """
+
+    def __init__(self, items: Iterable[ContentItem] = ()):
+        self._is_post = array("b")
+        self._scores = array("q")
+        self._created = array("d") # NaN for items without a timestamp
+        self._subreddit_codes = array("I") # Index into _subreddits; 0 is None
+        self._subreddits = [None]
+        self._subreddit_index = {None: 0}
+        self._ids = _StringColumn()
+        self._texts = _StringColumn()
+        self._urls = _StringColumn()
+        self._titles = _StringColumn()
+        self._extra_urls = _StringColumn() # ContentItem.urls joined with newlines
+        self.extend(items)
+
+    def append(self, item: ContentItem) -> None:
+        self._is_post.append(item.type == "post")
+        self._scores.append(item.score or 0)
+        self._created.append(math.nan if item.created_utc is None else item.created_utc)
+        code = self._subreddit_index.get(item.subreddit)
+        if code is None:
+            code = self._subreddit_index[item.subreddit] = len(self._subreddits)
+            self._subreddits.append(item.subreddit)
+        self._subreddit_codes.append(code)
+        self._ids.append(item.id)
+        self._texts.append(item.text)
+        self._urls.append(item.url)
+        self._titles.append(item.title)
+        self._extra_urls.append("\n".join(item.urls))
+
+    def extend(self, items: Iterable[ContentItem]) -> None:
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __getitem__(self, index: int) -> ContentItem:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ContentBatch index out of range")
+        created_utc = self._created[index]
+        urls = self._extra_urls[index]
+        return ContentItem(type="post" if self._is_post[index] else "comment", id=self._ids[index],
+                           text=self._texts[index], url=self._urls[index],
+                           subreddit=self._subreddits[self._subreddit_codes[index]], score=self._scores[index],
+                           created_utc=None if math.isnan(created_utc) else created_utc,
+                           title=self._titles[index], urls=tuple(urls.split("\n")) if urls else ())
+
+    def __iter__(self) -> Iterator[ContentItem]:
+        return (self[index] for index in range(len(self)))
+
+    def to_items(self) -> List[ContentItem]:
+        return list(self)
+
+    def nbytes(self) -> int:
+        """
+        Returns the approximate memory held by the batch's buffers, in bytes.
+        """
+        arrays = (self._is_post, self._scores, self._created, self._subreddit_codes)
+        columns = (self._ids, self._texts, self._urls, self._titles, self._extra_urls)
+        return (sum(a.itemsize * len(a) for a in arrays) + sum(column.nbytes() for column in columns)
+                + sum(len(name) for name in self._subreddits if name))
+
+if __name__ == "__main__":
+    items = [
+        ContentItem(type="comment", id="c1", text="I really enjoy playing Elden Ring.", url="https://reddit.com/r/Eldenring/comments/123",
+                    subreddit="Eldenring", score=12, created_utc=1700000000.0),
+        ContentItem(type="post", id="p1", title="Looking for sci-fi books", text="", url="https://reddit.com/r/scifi/comments/456",
+                    subreddit="scifi", score=40, urls=("https://reddit.com/r/scifi/comments/456", "https://reddit.com/r/books/comments/789")),
+    ]
+    batch = ContentBatch(items)
+    assert batch.to_items() == items
+    print(f"{len(batch)} items in {batch.nbytes()} bytes")
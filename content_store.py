@@ -0,0 +1,175 @@
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+import praw
+
+from content_item import ContentItem
+from reddit_scraper import get_user_content
+from instrumentation import get_metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    username TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    url TEXT NOT NULL,
+    subreddit TEXT,
+    score INTEGER NOT NULL,
+    created_utc REAL NOT NULL,
+    fetched_utc REAL NOT NULL,
+    PRIMARY KEY (username, item_id)
+);
+CREATE INDEX IF NOT EXISTS items_by_score ON items (username, type, score DESC);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    last_refresh_utc REAL NOT NULL
+);
+"""
+
+class ContentStore:
+    """
+    An on-disk SQLite store of scraped Reddit comments and posts, keyed by username and item id.
+
+    The store is safe to share between threads (e.g. the scrape workers of a batch run).
+    Usernames are stored lowercased, since Reddit usernames are case-insensitive.
+    """
+
+    def __init__(self, path: str = "content_store.db"):
+        """
+        Opens (and creates, if needed) the store at the given path.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+        if "subreddit" not in columns: # Stores created before subreddits were kept
+            self._conn.execute("ALTER TABLE items ADD COLUMN subreddit TEXT")
+        self._conn.commit()
+
+    def last_refresh(self, username: str) -> float | None:
+        """
+        Returns the Unix time at which the user's content was last fetched, or None if never.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT last_refresh_utc FROM users WHERE username = ?",
+                                     (username.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def save_items(self, username: str, items: List[ContentItem], refreshed_utc: float) -> int:
+        """
+        Inserts or updates items for a user and records the refresh time.
+
+        Existing items are updated in place, so scores fetched again are kept current.
+
+        Args:
+            username (str): The Reddit username the items belong to.
+            items (List[ContentItem]): Comments and/or posts as returned by get_user_content.
+            refreshed_utc (float): Unix time at which fetching started.
+
+        Returns:
+            int: The number of items that were not in the store before.
+        """
+        key = username.lower()
+        rows = [(key, item.id, item.type, item.title if item.type == "post" else None, item.text, item.url,
+                 item.subreddit, item.score, item.created_utc, refreshed_utc) for item in items]
+        with self._lock, self._conn:
+            before = self._conn.execute("SELECT COUNT(*) FROM items WHERE username = ?", (key,)).fetchone()[0]
+            self._conn.executemany(
+                """INSERT INTO items (username, item_id, type, title, text, url, subreddit, score, created_utc, fetched_utc)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (username, item_id) DO UPDATE SET
+                       title = excluded.title, text = excluded.text, score = excluded.score,
+                       subreddit = COALESCE(excluded.subreddit, items.subreddit), fetched_utc = excluded.fetched_utc""",
+                rows,
+            )
+            after = self._conn.execute("SELECT COUNT(*) FROM items WHERE username = ?", (key,)).fetchone()[0]
+            self._conn.execute(
+                """INSERT INTO users (username, last_refresh_utc) VALUES (?, ?)
+                   ON CONFLICT (username) DO UPDATE SET last_refresh_utc = excluded.last_refresh_utc""",
+                (key, refreshed_utc),
+            )
+        return after - before
+
+    def get_user_content(self, username: str, limit: int = 100,
+                         max_age_days: float | None = None) -> Tuple[List[ContentItem], List[ContentItem]]:
+        """
+        Reads a user's stored comments and posts, highest score first.
+
+        Args:
+            username (str): The Reddit username.
+            limit (int): The maximum number of comments and of posts to return.
+            max_age_days (float | None): Ignore items older than this many days.
+
+        Returns:
+            Tuple[List[ContentItem], List[ContentItem]]: (comments, posts) in the same format as
+                                           reddit_scraper.get_user_content.
+        """
+        cutoff_utc = time.time() - max_age_days * 86400 if max_age_days is not None else 0
+        query = """SELECT item_id, title, text, url, subreddit, score, created_utc FROM items
+                   WHERE username = ? AND type = ? AND created_utc >= ?
+                   ORDER BY score DESC LIMIT ?"""
+        with self._lock:
+            comment_rows = self._conn.execute(query, (username.lower(), "comment", cutoff_utc, limit)).fetchall()
+            post_rows = self._conn.execute(query, (username.lower(), "post", cutoff_utc, limit)).fetchall()
+        comments = [ContentItem(type="comment", id=item_id, text=text, url=url, subreddit=subreddit, score=score,
+                                created_utc=created_utc)
+                    for item_id, _, text, url, subreddit, score, created_utc in comment_rows]
+        posts = [ContentItem(type="post", id=item_id, title=title or "", text=text, url=url, subreddit=subreddit,
+                             score=score, created_utc=created_utc)
+                 for item_id, title, text, url, subreddit, score, created_utc in post_rows]
+        return comments, posts
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def refresh_user_content(reddit: praw.Reddit, store: ContentStore, username: str, limit: int = 100,
+                         max_chars: int | None = None,
+                         max_age_days: float | None = None,
+                         raise_on_error: bool = False) -> Tuple[List[ContentItem], List[ContentItem]]:
+    """
+    Brings a user's stored content up to date and returns it.
+
+    The first time a user is seen, their top comments and posts are fetched. On later calls only
+    the "new" listings are paginated, stopping at the first item older than the previous refresh,
+    which for a mostly-static account costs a single request per listing. That page-through is
+    not cut short by limit, max_chars or max_age_days: the refresh time moves forward afterwards,
+    so any item it skipped would never be fetched again.
+
+    Args:
+        reddit (praw.Reddit): An initialized PRAW Reddit instance.
+        store (ContentStore): The content store to read from and update.
+        username (str): The Reddit username.
+        limit (int): The maximum number of comments and of posts to return (and to fetch the
+                     first time).
+        max_chars (int | None): Character budget at which the first fetch stops early.
+        max_age_days (float | None): Ignore items older than this many days.
+        raise_on_error (bool): Re-raise fetch errors instead of returning what is already stored.
+
+    Returns:
+        Tuple[List[ContentItem], List[ContentItem]]: (comments, posts) from the store, highest score first.
+    """
+    last_refresh = store.last_refresh(username)
+    started_utc = time.time()
+    if last_refresh is None:
+        comments, posts = get_user_content(reddit, username, limit=limit, max_chars=max_chars,
+                                           max_age_days=max_age_days, raise_on_error=raise_on_error)
+    else:
+        print(f"Refreshing stored content for u/{username} (last refresh {time.ctime(last_refresh)})...")
+        comments, posts = get_user_content(reddit, username, limit=None, sort="new", since_utc=last_refresh,
+                                           raise_on_error=raise_on_error)
+    # An empty fetch may also be a swallowed scrape error, so only advance the refresh time
+    # when something was fetched; the next refresh then re-covers the same window.
+    if comments or posts:
+        added = store.save_items(username, comments + posts, started_utc)
+        get_metrics().incr("store_items_added", added)
+        print(f"Stored {added} new items for u/{username}.")
+    return store.get_user_content(username, limit=limit, max_age_days=max_age_days)
@@ -0,0 +1,165 @@
+import re
+import zlib
+from typing import List
+
+from content_item import ContentItem
+from instrumentation import get_metrics
+
+NUM_BINS = 64 # MinHash signature length
+BANDS = 16 # LSH bands of NUM_BINS // BANDS bins each; candidates share all bins of some band
+SIMILARITY_THRESHOLD = 0.8 # Estimated Jaccard similarity at which two items count as duplicates
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_BORROWED_OFFSET = 1 << 64 # Keeps borrowed values distinct from any bin's own value
+
+def dedup_text(item: ContentItem) -> str:
+    """
+    Returns the text an item is compared by: the title and body for posts, the body for comments.
+    """
+    if item.type == "post":
+        return f"{item.title} {item.text}"
+    return item.text
+
+def normalize_words(text: str) -> List[str]:
+    """
+    Lowercases text and splits it into words, dropping punctuation and formatting.
+    """
+    return _WORD_RE.findall(text.lower())
+
+def minhash_signature(words: List[str], num_bins: int = NUM_BINS) -> List[int]:
+    """
+    Computes a densified one-permutation MinHash signature over the word shingles of a text.
+
+    Each shingle is hashed once and only competes for the minimum of the bin its hash falls
+    into, so the cost is linear in the text length rather than in length times signature
+    size. Empty bins (for short texts) borrow the value of the nearest non-empty bin to their
+    right (wrapping around), which keeps the agreement rate between two signatures an estimate of the shingles'
+    Jaccard similarity. num_bins must be a power of two.
+    """
+    # crc32 for words and hash() of int tuples (which, unlike str hashing, is not randomized per
+    # process) keep signatures, and so the prompts, identical across runs
+    word_hashes = list(map(zlib.crc32, map(str.encode, words)))
+    if len(word_hashes) < SHINGLE_WORDS:
+        shingle_hashes = [hash(tuple(word_hashes))]
+    else:
+        shingle_hashes = list(map(hash, zip(*(word_hashes[i:] for i in range(SHINGLE_WORDS)))))
+    # In descending order, the last (smallest) hash per bin wins; within a bin, order by
+    # hash equals order by value
+    ordered = sorted(shingle_hashes, reverse=True)
+    shift = num_bins.bit_length() - 1
+    minima = dict(zip([h & (num_bins - 1) for h in ordered], [h >> shift for h in ordered]))
+    if len(minima) == num_bins:
+        return [minima[i] for i in range(num_bins)]
+    signature = [0] * num_bins
+    filled = sorted(minima)
+    previous = filled[-1] - num_bins # Negative indexes wrap around to the last bins
+    for bin_index in filled:
+        value = minima[bin_index]
+        for distance, target in enumerate(range(bin_index, previous, -1)):
+            signature[target] = value + distance * _BORROWED_OFFSET
+        previous = bin_index
+    return signature
+
+def estimate_similarity(signature_a: List[int], signature_b: List[int]) -> float:
+    """
+    Estimates the Jaccard similarity of two texts from their MinHash signatures.
+    """
+    return sum(1 for a, b in zip(signature_a, signature_b) if a == b) / len(signature_a)
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]] # Path halving
+        i = parent[i]
+    return i
+
+def _union(parent: List[int], i: int, j: int) -> None:
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    if root_i != root_j:
+        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+def dedup_items(user_content: List[ContentItem], threshold: float = SIMILARITY_THRESHOLD) -> List[ContentItem]:
+    """
+    Collapses exact and near-duplicate comments and posts into one representative each.
+
+    Items are first grouped by their normalized text (exact duplicates). The remaining distinct
+    texts are compared with MinHash and locality-sensitive hashing: signatures are split into
+    BANDS bands, and items sharing a band are merged if their estimated similarity reaches
+    threshold. Each item is only compared with the first item of its buckets, so the work
+    grows linearly with the number of items. Groups are formed with union-find.
+
+    From each group, the highest-scored item is kept (ties go to the most recent one). If the
+    group had duplicates, the kept item's urls are set (in place) to its own URL first, then
+    those of its duplicates in score order, so citations to any copy remain available.
+
+    Args:
+        user_content (List[ContentItem]): The items to collapse.
+        threshold (float): Minimum estimated Jaccard similarity of word shingles for near-duplicates.
+
+    Returns:
+        List[ContentItem]: The representatives, in the order of their first occurrence.
+    """
+    metrics = get_metrics()
+    with metrics.stage("dedup", items=len(user_content)):
+        parent = list(range(len(user_content)))
+
+        # Exact duplicates of the normalized text
+        first_by_text = {}
+        distinct = []
+        word_lists = {}
+        for i, item in enumerate(user_content):
+            words = normalize_words(dedup_text(item))
+            key = " ".join(words)
+            if key in first_by_text:
+                _union(parent, first_by_text[key], i)
+            else:
+                first_by_text[key] = i
+                distinct.append(i)
+                word_lists[i] = words
+
+        # Near duplicates among the distinct texts
+        rows = NUM_BINS // BANDS
+        signatures = {}
+        buckets = {}
+        for i in distinct:
+            if not word_lists[i]:
+                continue # Nothing to compare; empty texts are already grouped as exact duplicates
+            signature = signatures[i] = minhash_signature(word_lists[i])
+            for band in range(BANDS):
+                bucket_key = (band, *signature[band * rows:(band + 1) * rows])
+                first = buckets.setdefault(bucket_key, i)
+                if first != i and _find(parent, first) != _find(parent, i) \
+                        and estimate_similarity(signatures[first], signature) >= threshold:
+                    _union(parent, first, i)
+
+        groups = {}
+        for i in range(len(user_content)):
+            groups.setdefault(_find(parent, i), []).append(user_content[i])
+
+        representatives = []
+        for group in groups.values():
+            if len(group) == 1:
+                representatives.append(group[0])
+                continue
+            ranked = sorted(group, key=lambda item: (item.score or 0, item.created_utc or 0), reverse=True)
+            ranked[0].urls = tuple(dict.fromkeys(url for item in ranked for url in item.urls or (item.url,) if url))
+            representatives.append(ranked[0])
+
+    removed = len(user_content) - len(representatives)
+    metrics.incr("duplicates_removed", removed)
+    if removed:
+        print(f"Removed {removed} duplicate or near-duplicate items ({len(representatives)} remain).")
+    return representatives
+
+if __name__ == "__main__":
+    sample_content = [
+        ContentItem(type="comment", id="1", text="This is the way.", url="https://reddit.com/r/a/comments/1", score=3),
+        ContentItem(type="comment", id="2", text="This is the WAY!", url="https://reddit.com/r/b/comments/2", score=10),
+        ContentItem(type="comment", id="3", text="Honestly I think the new update really works for me but my job keeps me busy so weekends are for games.",
+                    url="https://reddit.com/r/c/comments/3", score=1),
+        ContentItem(type="comment", id="4", text="Honestly I think the new update really works for me but my job keeps me busy so weekends are for gaming.",
+                    url="https://reddit.com/r/d/comments/4", score=2),
+        ContentItem(type="post", id="5", title="Looking for sci-fi books", text="Just finished Dune.", url="https://reddit.com/r/e/comments/5", score=5),
+    ]
+    for item in dedup_items(sample_content):
+        print(item)
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+METRIC_PREFIX = "persona"
+
+class Metrics:
+    """
+    Thread-safe collector of per-stage wall time, counters and token usage for one run.
+
+    Stage timings and counters are aggregated for Prometheus-style export; each timed stage and
+    notable event is also written as one JSON line to the optional JSONL sink, tagged with the
+    run id, so individual users can be traced after the fact.
+    """
+
+    def __init__(self, jsonl_path: str | None = None):
+        """
+        Args:
+            jsonl_path (str | None): File to append JSON-lines events to, or None to keep aggregates only.
+        """
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_utc = time.time()
+        self._lock = threading.Lock()
+        self._stages = {}    # stage -> [count, total_seconds, max_seconds]
+        self._counters = {}  # (name, sorted label items) -> value
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+
+    def event(self, event: str, **fields) -> None:
+        """
+        Writes one event to the JSONL sink (no-op without a sink).
+        """
+        if self._jsonl is None:
+            return
+        line = json.dumps({"run_id": self.run_id, "ts": time.time(), "event": event, **fields}, default=str)
+        with self._lock:
+            self._jsonl.write(line + "\n")
+            self._jsonl.flush()
+
+    @contextmanager
+    def stage(self, name: str, **fields) -> Iterator[None]:
+        """
+        Times a pipeline stage. Extra fields (e.g. username) are only written to the JSONL event.
+        """
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stats = self._stages.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+            if error:
+                fields["error"] = error
+            self.event("stage", stage=name, seconds=round(seconds, 6), **fields)
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Adds value to a counter, e.g. incr("reddit_items_fetched", 100, type="comment").
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_usage(self, usage, **fields) -> None:
+        """
+        Records prompt and completion token counts from an OpenAI response's usage field.
+        """
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self.incr("llm_prompt_tokens", prompt_tokens)
+        self.incr("llm_completion_tokens", completion_tokens)
+        self.event("llm_usage", prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, **fields)
+
+    def snapshot(self) -> Dict:
+        """
+        Returns the aggregated stage timings and counters as a JSON-serializable dict.
+        """
+        with self._lock:
+            stages = {name: {"count": count, "total_seconds": round(total, 6), "max_seconds": round(peak, 6)}
+                      for name, (count, total, peak) in self._stages.items()}
+            counters = {}
+            for (name, labels), value in self._counters.items():
+                label_text = ",".join(f"{key}={val}" for key, val in labels)
+                counters[f"{name}{{{label_text}}}" if labels else name] = value
+        return {"run_id": self.run_id, "started_utc": self.started_utc,
+                "elapsed_seconds": round(time.time() - self.started_utc, 6), "stages": stages, "counters": counters}
+
+    def to_prometheus(self) -> str:
+        """
+        Renders the aggregates in the Prometheus text exposition format.
+        """
+        stage_metric = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [f"# HELP {stage_metric} Wall time spent per pipeline stage.",
+                 f"# TYPE {stage_metric} summary"]
+        with self._lock:
+            for name, (count, total, _) in sorted(self._stages.items()):
+                lines.append(f'{stage_metric}_sum{{stage="{name}"}} {total:.6f}')
+                lines.append(f'{stage_metric}_count{{stage="{name}"}} {count}')
+            counters = sorted(self._counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value:g}" if labels else f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Atomically writes the Prometheus text to path (e.g. for a node-exporter textfile collector).
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    def close(self) -> None:
+        """
+        Writes a run summary event and closes the JSONL sink.
+        """
+        self.event("run_summary", **self.snapshot())
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    """
+    Returns the process-wide Metrics instance the pipeline modules report to.
+    """
+    return _metrics
+
+def set_metrics(metrics: Metrics) -> Metrics:
+    """
+    Replaces the process-wide Metrics instance (e.g. to attach a JSONL sink for a run).
+    """
+    global _metrics
+    _metrics = metrics
+    return metrics
@@ -1,52 +1,366 @@
-import os
 import sys
-import re
-from dotenv import load_dotenv
+import argparse
+import sqlite3
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Tuple
+from openai import OpenAI
 
 # Import modules from the same project structure
-from reddit_scraper import init_reddit_api, get_user_content
-from persona_generator import generate_persona
-from utils import save_persona_to_file
+from reddit_scraper import init_reddit_api
+from content_store import ContentStore
+from persona_generator import generate_persona, generate_persona_map_reduce, stream_persona, update_persona, make_client
+from prompt_builder import DEFAULT_CONTENT_TOKEN_BUDGET
+from response_cache import ResponseCache
+from instrumentation import Metrics, get_metrics, set_metrics
+from rate_limiter import (RateLimitScheduler, set_scheduler, DEFAULT_REDDIT_RPM,
+                          DEFAULT_OPENAI_RPM, DEFAULT_OPENAI_TPM)
+from content_item import ContentBatch
+from output_sink import OutputSink
+from pipeline import (UPDATE_OVERLAP_SECONDS, get_username_from_url, parse_username, load_credentials,
+                      prepare_user_content, fetch_user_content, fetch_new_user_content)
 
-def get_username_from_url(url: str) -> str | None:
+def read_batch_entries(source: str) -> List[str]:
     """
-    Extracts the Reddit username from a given user profile URL.
+    Reads usernames or profile URLs for a batch run, one per line.
+
+    Blank lines and lines starting with '#' are ignored.
 
     Args:
-        url (str): The Reddit user profile URL.
+        source (str): Path to the input file, or "-" to read from stdin.
 
     Returns:
-        str | None: The extracted username or None if not found/invalid URL.
+        List[str]: The non-empty entries in input order.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def run_batch(entries: List[str], reddit, openai_client: OpenAI, limit: int = 200,
+              scrape_workers: int = 4, generate_workers: int = 4, output_dir: str = ".",
+              max_chars: int | None = None, max_age_days: float | None = None,
+              store: ContentStore | None = None, cache: ResponseCache | None = None,
+              token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET, map_reduce: bool = False,
+              merge: str = "llm", stream: bool = False, dedup: bool = True, update: bool = False,
+              retrieval_k: int | None = None, sink: OutputSink | None = None) -> List[Dict]:
+    """
+    Generates personas for many users, overlapping the scraping and generation stages.
+
+    Scraping and generation run in separate thread pools so their concurrency can be bounded
+    independently; a user moves to the generation pool as soon as its content is fetched.
+    The number of users that have been scraped but not yet generated is capped so that
+    fetched content does not pile up in memory when scraping outpaces the LLM.
+    A failure for one user is recorded and never aborts the rest of the batch. Personas are
+    handed to the sink's background writer, so generation workers never wait for the disk.
+
+    Args:
+        entries (List[str]): Usernames or profile URLs.
+        reddit (praw.Reddit): A shared, initialized PRAW Reddit instance.
+        openai_client (OpenAI): A shared OpenAI client.
+        limit (int): The maximum number of top comments and posts to fetch per user.
+        scrape_workers (int): Maximum number of users being scraped concurrently.
+        generate_workers (int): Maximum number of concurrent persona generation calls.
+        output_dir (str): Directory the persona files are written to, if no sink is given.
+        max_chars (int | None): Per-user character budget at which fetching stops early.
+        max_age_days (float | None): Ignore items older than this many days.
+        store (ContentStore | None): Local content store used for incremental refreshes.
+        cache (ResponseCache | None): LLM response cache shared by all generation workers.
+        token_budget (int): Maximum tokens of user content per persona prompt (per chunk in map-reduce mode).
+        map_reduce (bool): Process each user's full history in parallel chunks instead of truncating it.
+        merge (str): How map-reduce findings are merged, "llm" or "local".
+        stream (bool): Write each persona to its file incrementally as it is generated.
+        dedup (bool): Collapse exact and near-duplicate items before building prompts.
+        update (bool): For users with a saved persona in the sink, revise it with only the
+                       activity since it was generated. Other users get a full persona.
+        retrieval_k (int | None): Build prompts from the top retrieval_k items per persona section
+                                  instead of packing the highest-ranked items into the budget.
+        sink (OutputSink | None): Where the personas are written and looked up. By default, a sink
+                                  writing flat into output_dir is opened and closed by this call.
+
+    Returns:
+        List[Dict]: One result per entry, in input order, with 'entry', 'username',
+                    'status' ("ok", "skipped" or "failed"), 'path' and 'error' keys, and
+                    'timings' with the seconds spent per stage ("scrape", "prepare", "generate").
+                    Scraped users also have 'scraped_utc', the Unix time fetching started, which
+                    is indexed as the persona's generation time. Time spent writing files is recorded by the sink as the "save_persona" stage.
+    """
+    own_sink = sink is None
+    if own_sink:
+        sink = OutputSink(output_dir)
+    results = [{"entry": entry, "username": parse_username(entry), "status": "failed", "path": None, "error": None,
+                "timings": {}} for entry in entries]
+    # Bounds the users whose content is held in memory while waiting for generation; while
+    # waiting, it is held in compact ContentBatches rather than as one object per item
+    in_flight = threading.BoundedSemaphore(scrape_workers + 2 * generate_workers)
+    pending_writes = [] # (result, future from sink.write)
+
+    def scrape(result: Dict) -> Tuple[ContentBatch, ContentBatch]:
+        start = time.perf_counter()
+        result["scraped_utc"] = time.time() # The persona covers activity up to here
+        try:
+            previous = sink.load(result["username"]) if update else None
+            if previous is not None:
+                result["previous_persona"] = previous[0]
+                comments, posts = fetch_new_user_content(reddit, result["username"],
+                                                         previous[1] - UPDATE_OVERLAP_SECONDS,
+                                                         store=store, limit=limit, max_chars=max_chars,
+                                                         raise_on_error=True)
+            else:
+                comments, posts = fetch_user_content(reddit, result["username"], store=store, limit=limit,
+                                                     max_chars=max_chars, max_age_days=max_age_days,
+                                                     raise_on_error=True)
+            return ContentBatch(comments), ContentBatch(posts)
+        finally:
+            result["timings"]["scrape"] = time.perf_counter() - start
+
+    def generate(result: Dict, comments: ContentBatch, posts: ContentBatch) -> None:
+        try:
+            username = result["username"]
+            timings = result["timings"]
+            start = time.perf_counter()
+            all_user_content, activity_stats = prepare_user_content(comments.to_items(), posts.to_items(),
+                                                                    dedup=dedup)
+            timings["prepare"] = time.perf_counter() - start
+            start = time.perf_counter()
+            if "previous_persona" in result:
+                persona_content = update_persona(None, result.pop("previous_persona"), all_user_content, username,
+                                                 client=openai_client, raise_on_error=True, cache=cache,
+                                                 content_token_budget=token_budget)
+            elif stream:
+                path = sink.stream(username, stream_persona(None, all_user_content, username,
+                                                            client=openai_client, cache=cache,
+                                                            content_token_budget=token_budget,
+                                                            retrieval_k=retrieval_k,
+                                                            activity_stats=activity_stats),
+                                   generated_utc=result["scraped_utc"])
+                timings["generate"] = time.perf_counter() - start
+                if path:
+                    result["status"], result["path"] = "ok", path
+                else:
+                    result["error"] = "Streaming the persona failed; partial output kept in a .part file."
+                return
+            elif map_reduce:
+                persona_content = generate_persona_map_reduce(None, all_user_content, username, client=openai_client,
+                                                              raise_on_error=True, cache=cache,
+                                                              chunk_token_budget=token_budget, merge=merge,
+                                                              activity_stats=activity_stats)
+            else:
+                persona_content = generate_persona(None, all_user_content, username,
+                                                   client=openai_client, raise_on_error=True, cache=cache,
+                                                   content_token_budget=token_budget, retrieval_k=retrieval_k,
+                                                   activity_stats=activity_stats)
+            timings["generate"] = time.perf_counter() - start
+            if not persona_content:
+                result["error"] = "Persona generation returned empty."
+                return
+            pending_writes.append((result, sink.write(username, persona_content, result["scraped_utc"])))
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=scrape_workers) as scrape_pool, \
+         ThreadPoolExecutor(max_workers=generate_workers) as generate_pool:
+        scrape_futures = {}
+        generate_futures = {}
+
+        def dispatch(done_futures) -> None:
+            for future in done_futures:
+                result = scrape_futures.pop(future)
+                try:
+                    comments, posts = future.result()
+                except Exception as e:
+                    result.pop("previous_persona", None)
+                    result["error"] = f"Scraping failed: {e}"
+                    in_flight.release()
+                    continue
+                if not comments and not posts and "previous_persona" in result:
+                    # Nothing new since the saved persona, which stays current
+                    del result["previous_persona"]
+                    result["status"], result["path"] = "ok", sink.locate(result["username"])
+                    in_flight.release()
+                    continue
+                if not comments and not posts:
+                    result["status"], result["error"] = "skipped", "No public comments or posts found."
+                    in_flight.release()
+                    continue
+                generate_futures[generate_pool.submit(generate, result, comments, posts)] = result
+
+        for result in results:
+            if not result["username"]:
+                result["error"] = "Invalid username or profile URL."
+                continue
+            while not in_flight.acquire(timeout=0.1):
+                dispatch([f for f in list(scrape_futures) if f.done()])
+            scrape_futures[scrape_pool.submit(scrape, result)] = result
+            dispatch([f for f in list(scrape_futures) if f.done()])
+
+        dispatch(as_completed(list(scrape_futures)))
+
+        for future in as_completed(generate_futures):
+            result = generate_futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                result["error"] = f"Persona generation failed: {e}"
+
+    for result, write in pending_writes:
+        path = write.result()
+        if path:
+            result["status"], result["path"] = "ok", path
+        else:
+            result["error"] = "Could not save persona file."
+    if own_sink:
+        sink.close()
+
+    metrics = get_metrics()
+    for result in results:
+        metrics.incr("users", status=result["status"])
+        metrics.event("user_result", username=result["username"], entry=result["entry"], status=result["status"],
+                      error=result["error"], timings=result["timings"])
+    return results
+
+def print_batch_report(results: List[Dict]) -> None:
     """
-    match = re.search(r"reddit\.com/user/([^/]+)", url)
-    if match:
-        return match.group(1)
-    return None
+    Prints a per-user status line and a summary for a batch run.
+
+    Args:
+        results (List[Dict]): Results as returned by run_batch.
+    """
+    print("\n--- Batch Report ---")
+    for result in results:
+        name = f"u/{result['username']}" if result["username"] else result["entry"]
+        if result["status"] == "ok":
+            print(f"[ok] {name} -> {result['path']}")
+        else:
+            print(f"[{result['status']}] {name}: {result['error']}")
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "skipped", "failed")}
+    print(f"{len(results)} users: {counts['ok']} succeeded, {counts['skipped']} skipped, {counts['failed']} failed.")
+
+def finish_metrics(metrics: Metrics, prometheus_path: str | None = None) -> None:
+    """
+    Closes the run's metrics, writing the summary event and the Prometheus file if requested.
+    """
+    metrics.close()
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+        print(f"Run metrics written to {prometheus_path}")
 
 def main():
     """
     Main function to orchestrate the Reddit user persona generation process.
     """
     # 1. Load environment variables
-    load_dotenv()
-    REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
-    REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
-    REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    credentials = load_credentials()
 
     # Check if all required environment variables are set
-    if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, OPENAI_API_KEY]):
+    if not credentials:
         print("Error: Missing one or more environment variables.")
         print("Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, and OPENAI_API_KEY are set in your .env file.")
         sys.exit(1)
 
     # 2. Parse command-line arguments
-    if len(sys.argv) != 2:
+    parser = argparse.ArgumentParser(
+        description="Generate Reddit user personas.",
+        usage="python main.py <reddit_user_profile_url>\n"
+              "       python main.py --batch <file|-> [options]",
+    )
+    parser.add_argument("user_url", nargs="?", help="Reddit user profile URL, e.g. https://www.reddit.com/user/kojied/")
+    parser.add_argument("--batch", metavar="FILE", help="File with one username or profile URL per line ('-' for stdin).")
+    parser.add_argument("--scrape-workers", type=int, default=4, help="Concurrent Reddit scrapes in batch mode (default: 4).")
+    parser.add_argument("--generate-workers", type=int, default=4, help="Concurrent OpenAI calls in batch mode (default: 4).")
+    parser.add_argument("--limit", type=int, default=200, help="Top comments and posts to fetch per user (default: 200).")
+    parser.add_argument("--max-chars", type=int, help="Stop fetching a user's content once this many characters are gathered.")
+    parser.add_argument("--max-age-days", type=float, help="Ignore comments and posts older than this many days.")
+    parser.add_argument("--store", metavar="PATH", help="SQLite content store for incremental refreshes of scraped history.")
+    parser.add_argument("--llm-cache", metavar="PATH", help="SQLite file caching LLM responses across runs.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_CONTENT_TOKEN_BUDGET,
+                        help=f"Maximum tokens of user content per prompt (default: {DEFAULT_CONTENT_TOKEN_BUDGET}).")
+    parser.add_argument("--map-reduce", action="store_true",
+                        help="Extract findings from the full history in parallel chunks, then merge them.")
+    parser.add_argument("--merge", choices=["llm", "local"], default="llm",
+                        help="How map-reduce findings are merged into the persona (default: llm).")
+    parser.add_argument("--retrieval-k", type=int, metavar="K",
+                        help="Give each persona section only its K most relevant items (BM25) for a compact prompt.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the persona to stdout and its file as it is generated.")
+    parser.add_argument("--update", action="store_true",
+                        help="Revise an existing persona file with only the activity since it was generated.")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Keep duplicate and near-duplicate comments and posts instead of collapsing them.")
+    parser.add_argument("--reddit-rpm", type=float, default=DEFAULT_REDDIT_RPM,
+                        help=f"Reddit requests per minute shared by all workers (default: {DEFAULT_REDDIT_RPM}).")
+    parser.add_argument("--openai-rpm", type=float, default=DEFAULT_OPENAI_RPM,
+                        help=f"OpenAI requests per minute shared by all workers (default: {DEFAULT_OPENAI_RPM}).")
+    parser.add_argument("--openai-tpm", type=float, default=DEFAULT_OPENAI_TPM,
+                        help=f"OpenAI tokens per minute shared by all workers (default: {DEFAULT_OPENAI_TPM}).")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries with backoff for rate-limited or failed API calls (default: 5).")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="Append per-stage timing and usage events as JSON lines.")
+    parser.add_argument("--metrics-prom", metavar="PATH",
+                        help="Write run metrics in Prometheus text format when the run ends.")
+    parser.add_argument("--output-dir", default=".", help="Directory for persona files (default: current directory).")
+    parser.add_argument("--shard-output", action="store_true",
+                        help="Spread persona files over hash-sharded subdirectories of the output directory.")
+    parser.add_argument("--archive", metavar="PATH",
+                        help="Also append every persona to an archive: gzipped JSON lines (.jsonl.gz) or SQLite (.db).")
+    args = parser.parse_args()
+
+    if bool(args.user_url) == bool(args.batch):
         print("Usage: python main.py <reddit_user_profile_url>")
+        print("       python main.py --batch <file|->")
         print("Example: python main.py https://www.reddit.com/user/kojied/")
         sys.exit(1)
 
-    user_url = sys.argv[1]
+    metrics = set_metrics(Metrics(args.metrics_jsonl))
+    atexit.register(finish_metrics, metrics, args.metrics_prom)
+    set_scheduler(RateLimitScheduler(reddit_rpm=args.reddit_rpm, openai_rpm=args.openai_rpm,
+                                     openai_tpm=args.openai_tpm, max_retries=args.max_retries))
+    try:
+        sink = OutputSink(args.output_dir, shard=args.shard_output, archive=args.archive)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Error: Could not open the output directory or archive: {e}")
+        sys.exit(1)
+    atexit.register(sink.close) # Runs before finish_metrics, so the final writes are counted
+
+    if args.stream and args.map_reduce:
+        print("Error: --stream cannot be combined with --map-reduce.")
+        sys.exit(1)
+    if args.retrieval_k is not None:
+        if args.retrieval_k < 1:
+            print("Error: --retrieval-k must be at least 1.")
+            sys.exit(1)
+        if args.map_reduce or args.update:
+            print("Error: --retrieval-k cannot be combined with --map-reduce or --update.")
+            sys.exit(1)
+
+    if args.batch:
+        try:
+            entries = read_batch_entries(args.batch)
+        except OSError as e:
+            print(f"Error: Could not read batch input {args.batch}: {e}")
+            sys.exit(1)
+
+        store = ContentStore(args.store) if args.store else None
+        cache = ResponseCache(args.llm_cache) if args.llm_cache else None
+        print(f"Starting batch persona generation for {len(entries)} users...")
+        reddit = init_reddit_api(credentials["REDDIT_CLIENT_ID"], credentials["REDDIT_CLIENT_SECRET"],
+                                 credentials["REDDIT_USER_AGENT"])
+        openai_client = make_client(credentials["OPENAI_API_KEY"])
+        results = run_batch(entries, reddit, openai_client, limit=args.limit,
+                            scrape_workers=args.scrape_workers, generate_workers=args.generate_workers,
+                            output_dir=args.output_dir, max_chars=args.max_chars,
+                            max_age_days=args.max_age_days, store=store, cache=cache,
+                            token_budget=args.token_budget, map_reduce=args.map_reduce, merge=args.merge,
+                            stream=args.stream, dedup=not args.no_dedup, update=args.update,
+                            retrieval_k=args.retrieval_k, sink=sink)
+        print_batch_report(results)
+        sys.exit(0 if all(r["status"] != "failed" for r in results) else 1)
+
+    user_url = args.user_url
     username = get_username_from_url(user_url)
 
     if not username:
@@ -58,13 +372,50 @@ def main():
 
     try:
         # 3. Initialize Reddit API
-        reddit = init_reddit_api(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT)
+        reddit = init_reddit_api(credentials["REDDIT_CLIENT_ID"], credentials["REDDIT_CLIENT_SECRET"],
+                                 credentials["REDDIT_USER_AGENT"])
         if not reddit:
             print("Failed to initialize Reddit API. Exiting.")
             sys.exit(1)
 
+        store = ContentStore(args.store) if args.store else None
+        cache = ResponseCache(args.llm_cache) if args.llm_cache else None
+        previous = sink.load(username) if args.update else None
+        scraped_utc = time.time() # The persona covers activity up to here
+        if previous is not None:
+            previous_persona, generated_utc = previous
+            print(f"Updating the persona generated {time.ctime(generated_utc)} with newer activity only...")
+            try:
+                comments, posts = fetch_new_user_content(reddit, username, generated_utc - UPDATE_OVERLAP_SECONDS,
+                                                         store=store, limit=args.limit, max_chars=args.max_chars,
+                                                         raise_on_error=True)
+            except Exception as e:
+                print(f"Error: Could not fetch new activity for u/{username}: {e}; the persona is unchanged.")
+                sys.exit(1)
+            if not comments and not posts:
+                # The file is left untouched so its time still marks what the persona covers
+                print(f"No new activity for u/{username}; the persona is unchanged.")
+                return
+            new_content, _ = prepare_user_content(comments, posts, dedup=not args.no_dedup)
+            persona_content = update_persona(credentials["OPENAI_API_KEY"], previous_persona, new_content, username,
+                                             cache=cache, content_token_budget=args.token_budget)
+            if persona_content is None:
+                print(f"Persona update failed for u/{username}; the previous persona was kept.")
+                sys.exit(1)
+            sink.write(username, persona_content, scraped_utc).result()
+            print(f"\nPersona update complete for u/{username}.")
+            return
+        if args.update:
+            print(f"No saved persona for u/{username} in {args.output_dir}; generating a full persona.")
+
         # 4. Fetch user comments and posts
-        comments, posts = get_user_content(reddit, username, limit=200) # Fetch more content for better persona
+        try:
+            comments, posts = fetch_user_content(reddit, username, store=store, limit=args.limit,
+                                                 max_chars=args.max_chars, max_age_days=args.max_age_days,
+                                                 raise_on_error=True) # Fetch more content for better persona
+        except Exception as e:
+            print(f"Error: Could not fetch content for u/{username}: {e}")
+            sys.exit(1)
 
         if not comments and not posts:
             print(f"No public comments or posts found for u/{username}. Cannot generate persona.")
@@ -72,22 +423,34 @@ def main():
 
         # 5. Prepare content for LLM
         # Combine and preprocess text, ensuring URLs are kept for citations
-        all_user_content = []
-        for comment in comments:
-            # Preprocessing here is minimal to retain original text for LLM context
-            all_user_content.append({"type": "comment", "text": comment["text"], "url": comment["url"]})
-        for post in posts:
-            # Use selftext if available, otherwise title
-            text_content = post["text"] if post["text"] else post["title"]
-            all_user_content.append({"type": "post", "text": text_content, "url": post["url"], "title": post["title"]})
+        all_user_content, activity_stats = prepare_user_content(comments, posts, dedup=not args.no_dedup)
 
         # 6. Generate the user persona
         print("Generating user persona using OpenAI API...")
-        persona_content = generate_persona(OPENAI_API_KEY, all_user_content, username)
-        
+        if args.stream:
+            chunks = stream_persona(credentials["OPENAI_API_KEY"], all_user_content, username, cache=cache,
+                                    content_token_budget=args.token_budget, retrieval_k=args.retrieval_k,
+                                    activity_stats=activity_stats)
+            path = sink.stream(username, chunks, on_chunk=lambda chunk: print(chunk, end="", flush=True),
+                               generated_utc=scraped_utc)
+            if path:
+                print(f"\nPersona generation complete for u/{username}.")
+            else:
+                print(f"\nPersona generation failed for u/{username}.")
+                sys.exit(1)
+            return
+        if args.map_reduce:
+            persona_content = generate_persona_map_reduce(credentials["OPENAI_API_KEY"], all_user_content, username,
+                                                          cache=cache, chunk_token_budget=args.token_budget,
+                                                          merge=args.merge, activity_stats=activity_stats)
+        else:
+            persona_content = generate_persona(credentials["OPENAI_API_KEY"], all_user_content, username, cache=cache,
+                                               content_token_budget=args.token_budget, retrieval_k=args.retrieval_k,
+                                               activity_stats=activity_stats)
+
         if persona_content:
             # 7. Save the generated persona to a text file
-            save_persona_to_file(username, persona_content)
+            sink.write(username, persona_content, scraped_utc).result()
             print(f"\nPersona generation complete for u/{username}.")
         else:
             print(f"Persona generation failed or returned empty for u/{username}.")
@@ -0,0 +1,366 @@
+import gzip
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Callable, List, Dict, TextIO, Tuple
+
+from instrumentation import get_metrics
+
+INDEX_FILENAME = "persona_index.db"
+SHARD_LEVELS = 2 # Directory levels of two hex digits each, i.e. 65,536 leaf directories
+WRITE_QUEUE_SIZE = 256 # Personas waiting for the writer before write() blocks
+MAX_WRITE_BATCH = 64 # Writes committed to the index (and archive) in one transaction
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS personas (
+    username TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    generated_utc REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+"""
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS persona_archive (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    generated_utc REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    persona TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS persona_archive_by_user ON persona_archive (username, generated_utc);
+"""
+
+def persona_filename(username: str) -> str:
+    return f"{username}_persona.txt"
+
+def shard_dir(output_dir: str, username: str, levels: int = SHARD_LEVELS) -> str:
+    """
+    Returns the directory a user's persona goes to when output is sharded.
+
+    The directories are taken from a hash of the lowercased username, so users spread evenly
+    over them and a username always maps to the same directory.
+    """
+    digest = hashlib.sha1(username.lower().encode("utf-8")).hexdigest()
+    return os.path.join(output_dir, *(digest[2 * i:2 * i + 2] for i in range(levels)))
+
+@contextmanager
+def atomic_open(path: str, temp_path: str | None = None) -> Iterator[TextIO]:
+    """
+    Opens a temporary file that replaces path once the with block completes.
+
+    On success the file is flushed to disk and then renamed over path, so readers see either
+    the old file or the complete new one. If the block raises, path is left untouched.
+
+    Args:
+        path (str): The file to replace; its directory is created if needed.
+        temp_path (str | None): Where to write until then. By default a uniquely named temporary
+                                file next to path, removed on failure; a given temp_path is kept
+                                on failure, so partial output survives.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    keep_on_error = temp_path is not None
+    if temp_path is None:
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        f = os.fdopen(fd, "w", encoding="utf-8")
+    else:
+        f = open(temp_path, "w", encoding="utf-8")
+    try:
+        with f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if not keep_on_error:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        raise
+
+def atomic_write(path: str, content: str) -> None:
+    """
+    Writes content to path so that readers see either the old file or the complete new one.
+
+    A crash at any point leaves at most a stray temporary file (see atomic_open).
+    """
+    with atomic_open(path) as f:
+        f.write(content)
+
+class OutputSink:
+    """
+    Writes persona files atomically from a background thread and keeps an index of them.
+
+    Callers hand over the persona text and get a Future back immediately; a single writer
+    thread writes the files (see atomic_write) and records each one in a SQLite index in the
+    output directory, mapping username to path, generation time and SHA-256 of the content.
+    The writer commits whatever has queued up in one transaction, so index updates stay cheap
+    at high volume. Optionally, every persona is also appended to an archive: a gzipped JSON
+    lines file (one JSON object per persona) or a table in a SQLite database.
+
+    With shard=True, files go to hash-sharded subdirectories (see shard_dir) instead of all
+    into output_dir. Usernames are indexed lowercased, since Reddit usernames are case-insensitive.
+    """
+
+    def __init__(self, output_dir: str = ".", shard: bool = False, archive: str | None = None,
+                 queue_size: int = WRITE_QUEUE_SIZE):
+        """
+        Args:
+            output_dir (str): Directory for the persona files and the index.
+            shard (bool): Spread the files over hash-sharded subdirectories.
+            archive (str | None): Path of an append-only archive of every persona written:
+                                  "*.gz" for gzipped JSON lines, "*.db", "*.sqlite" or "*.sqlite3"
+                                  for SQLite. None disables the archive.
+            queue_size (int): Maximum number of personas waiting to be written; write() blocks beyond it.
+
+        Raises:
+            ValueError: If the archive path has an unsupported extension.
+        """
+        if archive and not archive.endswith((".gz", ".db", ".sqlite", ".sqlite3")):
+            raise ValueError(f"Unsupported archive format: {archive} (use .jsonl.gz, .db or .sqlite)")
+        self.output_dir = output_dir
+        self.shard = shard
+        self.archive = archive
+        os.makedirs(output_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._enqueue_lock = threading.Lock() # Orders writes against close()
+        self._conn = sqlite3.connect(os.path.join(output_dir, INDEX_FILENAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(INDEX_SCHEMA)
+        self._conn.commit()
+        self._archive_conn = None
+        if archive and not archive.endswith(".gz"):
+            self._archive_conn = sqlite3.connect(archive, check_same_thread=False)
+            self._archive_conn.executescript(ARCHIVE_SCHEMA)
+            self._archive_conn.commit()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="persona-writer")
+        self._writer.start()
+
+    def path_for(self, username: str) -> str:
+        """
+        Returns the path a new persona for username is written to.
+        """
+        directory = shard_dir(self.output_dir, username) if self.shard else self.output_dir
+        return os.path.join(directory, persona_filename(username))
+
+    def write(self, username: str, content: str, generated_utc: float | None = None) -> Future:
+        """
+        Queues a persona to be written and returns without waiting for the disk.
+
+        Args:
+            username (str): The Reddit username the persona is about.
+            content (str): The complete persona.
+            generated_utc (float | None): Unix time at which fetching the content the persona is
+                                          based on started, recorded in the index so that an
+                                          update fetches everything after it. Defaults to now.
+
+        Returns:
+            Future: Resolves to the written file's path, or None if writing failed.
+
+        Raises:
+            RuntimeError: If the sink has been closed.
+        """
+        future = Future()
+        self._enqueue((username, content, generated_utc if generated_utc is not None else time.time(), True,
+                       future))
+        return future
+
+    def stream(self, username: str, persona_chunks: Iterable[str],
+               on_chunk: Callable[[str], None] | None = None, generated_utc: float | None = None) -> str | None:
+        """
+        Writes a persona to its file incrementally as the pieces arrive.
+
+        The pieces are appended to "<path>.part" and flushed as they arrive, so a partial persona
+        survives an interrupted run. Once the stream completes, the part file is synced to disk
+        and renamed into place (see atomic_open). Only the index and archive updates are left to
+        the writer thread.
+
+        Args:
+            username (str): The Reddit username the persona is about.
+            persona_chunks (Iterable[str]): The persona text in pieces, e.g. from stream_persona.
+            on_chunk (Callable[[str], None] | None): Called with each piece after it is written.
+            generated_utc (float | None): Unix time at which fetching the content started, as for write().
+
+        Returns:
+            str | None: The path of the finished file, or None if the stream or the write failed.
+
+        Raises:
+            RuntimeError: If the sink is closed before the stream starts or completes; in the
+                          latter case the file is in place but not indexed.
+        """
+        if self._closed:
+            raise RuntimeError("The output sink is closed.")
+        path = self.path_for(username)
+        part_path = path + ".part"
+        pieces = []
+        try:
+            with atomic_open(path, temp_path=part_path) as f:
+                for chunk in persona_chunks:
+                    f.write(chunk)
+                    f.flush()
+                    pieces.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+        except IOError as e:
+            print(f"Error saving persona to file {path}: {e}")
+            return None
+        except Exception as e:
+            print(f"Persona generation was interrupted ({e}); partial output kept in {part_path}")
+            return None
+        self._enqueue((username, "".join(pieces), generated_utc if generated_utc is not None else time.time(),
+                       False, Future()))
+        print(f"Successfully saved user persona to {path}")
+        return path
+
+    def lookup(self, username: str) -> Dict | None:
+        """
+        Returns the index entry for username ('path', 'generated_utc', 'sha256' and 'bytes'), or None.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path, generated_utc, sha256, bytes FROM personas WHERE username = ?",
+                                     (username.lower(),)).fetchone()
+        return dict(zip(("path", "generated_utc", "sha256", "bytes"), row)) if row else None
+
+    def locate(self, username: str) -> str | None:
+        """
+        Returns the path of the user's saved persona, or None if there is none.
+
+        Files written before the index existed are found at their flat or sharded path.
+        """
+        entry = self.lookup(username)
+        candidates = ([entry["path"]] if entry else []) + [self.path_for(username),
+                                                          os.path.join(self.output_dir, persona_filename(username))]
+        return next((path for path in candidates if os.path.exists(path)), None)
+
+    def load(self, username: str) -> Tuple[str, float] | None:
+        """
+        Loads the user's saved persona and the time it was generated.
+
+        Returns:
+            Tuple[str, float] | None: The persona text and its generation time (a Unix timestamp,
+                                      from the index, or the file's modification time for files
+                                      not in it), or None if there is no readable saved persona.
+        """
+        entry = self.lookup(username)
+        path = self.locate(username)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            if entry and entry["path"] == path:
+                return content, entry["generated_utc"]
+            return content, os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def flush(self) -> None:
+        """
+        Waits until every queued persona has been written and indexed.
+        """
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        Writes the remaining queued personas, then stops the writer and closes the index.
+
+        Later calls to write() and stream() raise RuntimeError.
+        """
+        with self._enqueue_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+            if self._archive_conn is not None:
+                self._archive_conn.close()
+
+    def _enqueue(self, entry: Tuple) -> None:
+        with self._enqueue_lock:
+            if self._closed:
+                raise RuntimeError("The output sink is closed.")
+            self._queue.put(entry)
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < MAX_WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            writes = [entry for entry in batch if entry is not None]
+            try:
+                if writes:
+                    self._write_batch(writes)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, writes: List[Tuple]) -> None:
+        metrics = get_metrics()
+        records = []
+        for username, content, generated_utc, write_file, future in writes:
+            path = self.path_for(username)
+            try:
+                if write_file:
+                    with metrics.stage("save_persona", username=username):
+                        atomic_write(path, content)
+                data = content.encode("utf-8")
+                records.append((username, path, generated_utc, hashlib.sha256(data).hexdigest(), len(data), content,
+                                write_file, future))
+            except Exception as e:
+                print(f"Error saving persona to file {path}: {e}")
+                future.set_result(None)
+        if not records:
+            return
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    """INSERT INTO personas (username, path, generated_utc, sha256, bytes) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (username) DO UPDATE SET path = excluded.path, generated_utc = excluded.generated_utc,
+                           sha256 = excluded.sha256, bytes = excluded.bytes""",
+                    [(username.lower(), path, generated_utc, digest, size)
+                     for username, path, generated_utc, digest, size, _, _, _ in records],
+                )
+            if self.archive:
+                self._append_archive(records)
+        except Exception as e:
+            # The files are in place; only their index or archive entries are missing
+            print(f"Error recording {len(records)} personas in the index or archive: {e}")
+        metrics.incr("personas_written", len(records))
+        for _, path, _, _, _, _, write_file, future in records:
+            if write_file: # Streamed personas were reported when their file was renamed into place
+                print(f"Successfully saved user persona to {path}")
+            future.set_result(path)
+
+    def _append_archive(self, records: List[Tuple]) -> None:
+        rows = [(username, generated_utc, digest, content)
+                for username, _, generated_utc, digest, _, content, _, _ in records]
+        if self._archive_conn is not None:
+            with self._lock, self._archive_conn:
+                self._archive_conn.executemany(
+                    "INSERT INTO persona_archive (username, generated_utc, sha256, persona) VALUES (?, ?, ?, ?)", rows)
+            return
+        # Each batch is appended as its own gzip member; concatenated members form a valid gzip file
+        lines = "".join(json.dumps({"username": username, "generated_utc": generated_utc, "sha256": digest,
+                                    "persona": content}, ensure_ascii=False) + "\n"
+                        for username, generated_utc, digest, content in rows)
+        with gzip.open(self.archive, "at", encoding="utf-8") as f:
+            f.write(lines)
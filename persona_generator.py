@@ -1,49 +1,175 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from openai import APIError
-from typing import List, Dict
+from typing import List, Dict, Iterator
+from content_item import ContentItem
+from response_cache import ResponseCache, make_cache_key
+from prompt_builder import build_content_block, chunk_content, count_tokens, DEFAULT_CONTENT_TOKEN_BUDGET
+from instrumentation import get_metrics
+from rate_limiter import get_scheduler
+from analytics import compute_activity_stats, format_activity_block
+from retrieval import build_retrieval_block
 
-def generate_persona(openai_api_key: str, user_content: List[Dict], username: str) -> str:
+MODEL = "gpt-3.5-turbo" # or "gpt-4o" if preferred and available
+TEMPERATURE = 0.5
+MAX_TOKENS = 1500
+SYSTEM_PROMPT = "You are an AI assistant specialized in creating detailed user personas from text data."
+
+# Sections of the persona template, in output order
+PERSONA_SECTIONS = ["Demographics", "Behavior & Habits", "Frustrations", "Goals & Needs",
+                    "Motivations", "Personality Traits", "Online Behavior", "Quote"]
+MAP_MAX_TOKENS = 1000 # Completion limit for each partial extraction
+MAX_FINDINGS_PER_SECTION = 12
+
+def make_client(openai_api_key: str) -> OpenAI:
     """
-    Generates a user persona based on provided user content using the Google Gemini API.
+    Creates an OpenAI client. With a rate-limit scheduler installed, the client's own retries are
+    disabled, as the scheduler retries with backoff shared across all workers.
+    """
+    if get_scheduler() is not None:
+        return OpenAI(api_key=openai_api_key, max_retries=0)
+    return OpenAI(api_key=openai_api_key)
+
+def _create_chat_completion(client: OpenAI, llm_prompt: str, max_tokens: int, **extra_args):
+    """
+    Makes the chat completion request, through the rate-limit scheduler if one is installed.
+
+    Scheduled requests count their prompt plus max_tokens against the token quota, and the
+    rate-limit headers of each response are fed back into the scheduler's buckets.
+    """
+    request_args = dict(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": llm_prompt}
+        ],
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+        **extra_args
+    )
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return client.chat.completions.create(**request_args)
+
+    def send():
+        raw_response = client.chat.completions.with_raw_response.create(**request_args)
+        scheduler.update_from_headers("openai", raw_response.headers)
+        return raw_response.parse()
+
+    return scheduler.call("openai", send, tokens=count_tokens(SYSTEM_PROMPT) + count_tokens(llm_prompt) + max_tokens)
+
+def request_completion(client: OpenAI, llm_prompt: str, cache: ResponseCache | None = None,
+                       max_tokens: int = MAX_TOKENS, json_mode: bool = False) -> str | None:
+    """
+    Sends one chat completion request, answering it from the cache when possible.
 
     Args:
-        gemini_api_key (str): Your Google Gemini API key.
-        user_content (List[Dict]): A list of dictionaries, where each dict represents
-                                   a comment or post with 'text' and 'url' keys.
-        username (str): The Reddit username for the persona title.
+        client (OpenAI): The OpenAI client.
+        llm_prompt (str): The user prompt.
+        cache (ResponseCache | None): Response cache; hits skip the network call entirely.
+        max_tokens (int): Completion token limit.
+        json_mode (bool): Ask the model for a JSON object response.
 
     Returns:
-        str: The generated user persona in Markdown format.
+        str | None: The response text, or None if the API returned an empty response.
 
     Raises:
-        ValueError: If the Gemini API key is missing or invalid.
-        generation_types.BlockedPromptException: If the prompt is blocked by safety filters.
-        Exception: For any other unexpected errors.
+        APIError: If the OpenAI API call fails.
     """
-    if not openai_api_key:
-        raise ValueError("OPENAI_API_KEY is not set. Please configure it in your .env file.")
+    metrics = get_metrics()
+    cache_key = make_cache_key(MODEL, TEMPERATURE, max_tokens, SYSTEM_PROMPT, llm_prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("Using cached response (identical prompt seen before).")
+            metrics.incr("llm_cache_hits")
+            return cached
+        metrics.incr("llm_cache_misses")
 
-    client = OpenAI(api_key=openai_api_key)
+    extra_args = {"response_format": {"type": "json_object"}} if json_mode else {}
+    metrics.incr("llm_requests")
+    with metrics.stage("llm_call", max_tokens=max_tokens, json_mode=json_mode):
+        response = _create_chat_completion(client, llm_prompt, max_tokens, **extra_args)
+    metrics.record_usage(getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if content and cache is not None:
+        cache.put(cache_key, content)
+    return content or None
 
-    # Prepare user content for the LLM, ensuring URLs are embedded with text
-    combined_text_for_llm = ""
-    for item in user_content:
-        content_type = item.get("type", "unknown").capitalize()
-        content_text = item.get("text", "")
-        content_url = item.get("url", "")
-        content_title = item.get("title", "") # For posts, selftext might be empty, use title
-
-        # Use title if selftext is empty for posts
-        if content_type == "Post" and not content_text and content_title:
-            content_text = content_title
-
-        if content_text: # Only add if there's actual text content
-            combined_text_for_llm += f"- {content_type}: \"{content_text.strip()}\" ({content_url})\n"
-    
-    if not combined_text_for_llm.strip():
-        return f"### User Persona: {username}\n\nNo sufficient public content found to generate a persona."
+def stream_completion(client: OpenAI, llm_prompt: str, cache: ResponseCache | None = None,
+                      max_tokens: int = MAX_TOKENS) -> Iterator[str]:
+    """
+    Streams one chat completion as text deltas, answering it from the cache when possible.
+
+    A cache hit yields the whole cached response at once. The complete response is added
+    to the cache only once the stream has finished.
+
+    Args:
+        client (OpenAI): The OpenAI client.
+        llm_prompt (str): The user prompt.
+        cache (ResponseCache | None): Response cache; hits skip the network call entirely.
+        max_tokens (int): Completion token limit.
+
+    Yields:
+        str: Pieces of the response text as they arrive.
+
+    Raises:
+        APIError: If the OpenAI API call fails, including part-way through the stream.
+    """
+    metrics = get_metrics()
+    cache_key = make_cache_key(MODEL, TEMPERATURE, max_tokens, SYSTEM_PROMPT, llm_prompt)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print("Using cached response (identical prompt seen before).")
+            metrics.incr("llm_cache_hits")
+            yield cached
+            return
+        metrics.incr("llm_cache_misses")
+
+    metrics.incr("llm_requests")
+    parts = []
+    # The stage covers the whole stream, including time the consumer spends between pieces
+    with metrics.stage("llm_stream", max_tokens=max_tokens):
+        # Only opening the stream is retried; an error part-way through is raised to the consumer
+        stream = _create_chat_completion(client, llm_prompt, max_tokens, stream=True,
+                                         stream_options={"include_usage": True})
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                metrics.record_usage(chunk.usage)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    if parts and cache is not None:
+        cache.put(cache_key, "".join(parts))
+
+ACTIVITY_CITATION = "Activity statistics"
 
-    llm_prompt = f"""
+def build_persona_prompt(username: str, content_block: str, content_heading: str = "User Content to Analyze",
+                         activity_block: str = "") -> str:
+    """
+    Builds the persona prompt with the output template for a block of evidence.
+
+    Args:
+        username (str): The Reddit username for the persona title.
+        content_block (str): The evidence lines to analyze.
+        content_heading (str): Heading shown above the evidence.
+        activity_block (str): Precomputed activity statistics (see analytics.py) to use for
+                              posting frequency and subreddits instead of having them inferred.
+
+    Returns:
+        str: The full user prompt.
+    """
+    activity_section = ""
+    if activity_block:
+        activity_section = f"""
+**Precomputed Activity Statistics:**
+These are exact. Use them for "Frequency of Posting/Commenting" and "Subreddits Engaged In" instead of estimating from the content, and cite them as (Citation: {ACTIVITY_CITATION}).
+{activity_block}"""
+    return f"""
 You are an AI assistant specialized in creating detailed user personas from text data.
 Your task is to analyze the provided Reddit user content (posts and comments) and construct a comprehensive user persona.
 
@@ -96,31 +222,416 @@ Your task is to analyze the provided Reddit user content (posts and comments) an
 **Quote:**
 "[A representative quote from their content]" (Citation: [Link])
 ---
-
-**User Content to Analyze:**
-{combined_text_for_llm}
+{activity_section}
+**{content_heading}:**
+{content_block}
 """
+
+def build_evidence_block(user_content: List[ContentItem], username: str, content_token_budget: int,
+                         retrieval_k: int | None = None) -> str:
+    """
+    Builds the evidence lines for a persona prompt.
+
+    By default the highest-ranked items are packed into the token budget. With retrieval_k,
+    each template section instead gets its own top-k items from a BM25 index over all items
+    (see retrieval.py), which gives a much smaller prompt with more targeted citations.
+    """
+    with get_metrics().stage("build_prompt", username=username, items=len(user_content)):
+        if retrieval_k is not None:
+            combined_text_for_llm, included = build_retrieval_block(user_content, retrieval_k, content_token_budget)
+            print(f"Retrieved {included} of {len(user_content)} items as evidence for the persona sections.")
+            return combined_text_for_llm
+        combined_text_for_llm, included = build_content_block(user_content, content_token_budget)
+    if included < len(user_content):
+        print(f"Packed {included} of {len(user_content)} items into a {content_token_budget}-token content budget.")
+    return combined_text_for_llm
+
+def generate_persona(openai_api_key: str, user_content: List[ContentItem], username: str,
+                     client: OpenAI | None = None, raise_on_error: bool = False,
+                     cache: ResponseCache | None = None,
+                     content_token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                     retrieval_k: int | None = None, activity_stats: Dict | None = None) -> str | None:
+    """
+    Generates a user persona based on provided user content using the Google Gemini API.
+
+    Args:
+        gemini_api_key (str): Your Google Gemini API key.
+        user_content (List[ContentItem]): The user's comments and posts, e.g. from
+                                          prepare_user_content (score and created_utc
+                                          are used for ranking).
+        username (str): The Reddit username for the persona title.
+        client (OpenAI | None): An existing OpenAI client to reuse (e.g. across a batch run).
+                                If None, a new client is created from openai_api_key.
+        raise_on_error (bool): Re-raise OpenAI API errors, and return None for an empty response,
+                               instead of returning an error persona.
+        cache (ResponseCache | None): Response cache consulted before calling the API. A hit
+                                      for an identical request skips the network call entirely.
+        content_token_budget (int): Maximum tokens of user content in the prompt; the highest
+                                    ranked items are packed into it.
+        retrieval_k (int | None): If set, select evidence per persona section instead: the top
+                                  retrieval_k BM25 matches for each section's query.
+        activity_stats (Dict | None): Statistics from prepare_user_content, computed before
+                                      deduplication. If None, they are computed from user_content.
+
+    Returns:
+        str | None: The generated user persona in Markdown format (None only with raise_on_error,
+                    if the API returned an empty response).
+
+    Raises:
+        ValueError: If the Gemini API key is missing or invalid.
+        generation_types.BlockedPromptException: If the prompt is blocked by safety filters.
+        Exception: For any other unexpected errors.
+    """
+    if client is None:
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY is not set. Please configure it in your .env file.")
+        client = make_client(openai_api_key)
+
+    # Prepare user content for the LLM, ensuring URLs are embedded with text
+    combined_text_for_llm = build_evidence_block(user_content, username, content_token_budget, retrieval_k)
+
+    if not combined_text_for_llm.strip():
+        return f"### User Persona: {username}\n\nNo sufficient public content found to generate a persona."
+
+    # Statistics cover every scraped item, including duplicates and those that did not fit into the budget
+    if activity_stats is None:
+        activity_stats = compute_activity_stats(user_content)
+    llm_prompt = build_persona_prompt(username, combined_text_for_llm,
+                                      activity_block=format_activity_block(activity_stats))
+
     try:
         print("Sending content to OpenAI API for persona generation...")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # or "gpt-4o" if preferred and available
-            messages=[
-                {"role": "system", "content": "You are an AI assistant specialized in creating detailed user personas from text data."},
-                {"role": "user", "content": llm_prompt}
-            ],
-            temperature=0.5,
-            max_tokens=1500
-        )
+        persona_content = request_completion(client, llm_prompt, cache=cache)
         
-        if response.choices[0].message.content:
+        if persona_content:
             print("Persona generated successfully by OpenAI API.")
-            return response.choices[0].message.content
+            return persona_content
         else:
             print("OpenAI API returned an empty response.")
+            if raise_on_error:
+                return None
             return f"### User Persona: {username}\n\nCould not generate persona: OpenAI API returned empty response."
 
     except APIError as e:
         print(f"OpenAI API Error: {e}")
+        if raise_on_error:
+            raise
+        return f"### User Persona: {username}\n\nPersona generation failed due to OpenAI API error: {e}"
+
+def stream_persona(openai_api_key: str, user_content: List[ContentItem], username: str,
+                   client: OpenAI | None = None, cache: ResponseCache | None = None,
+                   content_token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                   retrieval_k: int | None = None, activity_stats: Dict | None = None) -> Iterator[str]:
+    """
+    Generates a user persona like generate_persona, but yields the text as it is generated.
+
+    Args:
+        openai_api_key (str): Your OpenAI API key.
+        user_content (List[ContentItem]): Items as accepted by generate_persona.
+        username (str): The Reddit username for the persona title.
+        client (OpenAI | None): An existing OpenAI client to reuse.
+        cache (ResponseCache | None): Response cache; a hit yields the cached persona at once.
+        content_token_budget (int): Maximum tokens of user content in the prompt.
+        retrieval_k (int | None): Retrieve this many items per section instead of packing the budget.
+        activity_stats (Dict | None): Precomputed statistics, as accepted by generate_persona.
+
+    Yields:
+        str: Pieces of the persona in Markdown format as they arrive.
+
+    Raises:
+        ValueError: If the OpenAI API key is missing.
+        APIError: If the OpenAI API call fails, including part-way through the stream.
+    """
+    if client is None:
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY is not set. Please configure it in your .env file.")
+        client = make_client(openai_api_key)
+
+    combined_text_for_llm = build_evidence_block(user_content, username, content_token_budget, retrieval_k)
+
+    if not combined_text_for_llm.strip():
+        yield f"### User Persona: {username}\n\nNo sufficient public content found to generate a persona."
+        return
+
+    print("Streaming persona from OpenAI API...")
+    if activity_stats is None:
+        activity_stats = compute_activity_stats(user_content)
+    llm_prompt = build_persona_prompt(username, combined_text_for_llm,
+                                      activity_block=format_activity_block(activity_stats))
+    yield from stream_completion(client, llm_prompt, cache=cache)
+
+def build_update_prompt(username: str, previous_persona: str, content_block: str) -> str:
+    """
+    Builds the prompt asking the model to revise an existing persona with new evidence only.
+
+    Args:
+        username (str): The Reddit username for the persona title.
+        previous_persona (str): The persona generated earlier.
+        content_block (str): Evidence lines for the activity since then.
+
+    Returns:
+        str: The full user prompt.
+    """
+    return f"""
+You are updating an existing user persona for the Reddit user u/{username} with their newest posts and comments.
+
+**Instructions:**
+- Keep the exact format, sections and headings of the existing persona.
+- Revise only what the new content adds to, changes or contradicts. Keep all other details and their citations as they are.
+- For every new or changed detail, you MUST provide a direct citation (URL) to the new post or comment supporting it.
+- If the new content adds nothing, return the existing persona unchanged.
+- Respond with the complete updated persona only.
+
+**Existing Persona:**
+{previous_persona.strip()}
+
+**New User Content to Analyze:**
+{content_block}
+"""
+
+def update_persona(openai_api_key: str, previous_persona: str, new_content: List[ContentItem], username: str,
+                   client: OpenAI | None = None, raise_on_error: bool = False, cache: ResponseCache | None = None,
+                   content_token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET) -> str | None:
+    """
+    Revises a previously generated persona using only the user's activity since then.
+
+    The prompt holds the previous persona plus the new items, so for a mostly-static account
+    it is a fraction of the size of a full regeneration. Without new items the previous
+    persona is returned as is, without calling the API.
+
+    Args:
+        openai_api_key (str): Your OpenAI API key.
+        previous_persona (str): The persona generated earlier, e.g. from OutputSink.load.
+        new_content (List[ContentItem]): Items created since the previous persona, as accepted by generate_persona.
+        username (str): The Reddit username for the persona title.
+        client (OpenAI | None): An existing OpenAI client to reuse.
+        raise_on_error (bool): Re-raise OpenAI API errors instead of returning None.
+        cache (ResponseCache | None): Response cache consulted before calling the API.
+        content_token_budget (int): Maximum tokens of new content in the prompt.
+
+    Returns:
+        str | None: The updated persona in Markdown format, or None if the update failed,
+                    in which case the previous persona should be kept.
+    """
+    if client is None:
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY is not set. Please configure it in your .env file.")
+        client = make_client(openai_api_key)
+
+    with get_metrics().stage("build_prompt", username=username, items=len(new_content)):
+        combined_text_for_llm, included = build_content_block(new_content, content_token_budget)
+    if included < len(new_content):
+        print(f"Packed {included} of {len(new_content)} new items into a {content_token_budget}-token content budget.")
+
+    if not combined_text_for_llm.strip():
+        print("No new activity; keeping the previous persona.")
+        return previous_persona
+
+    try:
+        print(f"Sending {included} new items to OpenAI API for a persona update...")
+        persona_content = request_completion(client, build_update_prompt(username, previous_persona,
+                                                                         combined_text_for_llm), cache=cache)
+        if persona_content:
+            print("Persona updated successfully by OpenAI API.")
+            return persona_content
+        print("OpenAI API returned an empty response; keeping the previous persona.")
+        return None
+
+    except APIError as e:
+        print(f"OpenAI API Error: {e}")
+        if raise_on_error:
+            raise
+        return None
+
+def build_extraction_prompt(content_block: str) -> str:
+    """
+    Builds the map-step prompt asking for structured findings from one chunk of content.
+    """
+    sections = ", ".join(f'"{section}"' for section in PERSONA_SECTIONS)
+    return f"""
+Analyze the following Reddit posts and comments from a single user and extract persona findings.
+
+**Instructions:**
+- Only extract information that can be directly inferred from the content below.
+- Every finding MUST cite the URL of the post or comment that supports it.
+- For "Demographics", start the finding with its field (Age, Gender, Location, Occupation/Status or Archetype), e.g. "Age: 25-30".
+- For "Online Behavior", start the finding with its field (Frequency of Posting/Commenting, Subreddits Engaged In or Tone of Communication).
+- For "Quote", the finding is a short verbatim quote that represents the user.
+- Respond with a JSON object of the form:
+{{"findings": [{{"section": <one of {sections}>, "finding": "<concise finding>", "citation": "<URL>"}}]}}
+
+**User Content to Analyze:**
+{content_block}
+"""
+
+def parse_findings(response_text: str) -> List[Dict]:
+    """
+    Parses the findings from a map-step response, ignoring malformed or uncited entries.
+
+    Args:
+        response_text (str): The model's JSON response (optionally wrapped in a code fence).
+
+    Returns:
+        List[Dict]: Findings with 'section', 'finding' and 'citation' keys.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", response_text.strip())
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return []
+    raw_findings = data.get("findings", []) if isinstance(data, dict) else data
+    findings = []
+    for raw in raw_findings if isinstance(raw_findings, list) else []:
+        if not isinstance(raw, dict):
+            continue
+        section = str(raw.get("section", "")).strip()
+        finding = str(raw.get("finding", "")).strip()
+        citation = str(raw.get("citation", "")).strip()
+        if section in PERSONA_SECTIONS and finding and citation:
+            findings.append({"section": section, "finding": finding, "citation": citation})
+    return findings
+
+def group_findings(findings: List[Dict], per_section: int = MAX_FINDINGS_PER_SECTION) -> Dict[str, List[Dict]]:
+    """
+    Groups findings by template section, dropping duplicates and keeping at most per_section each.
+
+    Findings keep their input order, so findings from the highest-ranked chunks come first.
+    """
+    grouped = {section: [] for section in PERSONA_SECTIONS}
+    seen = set()
+    for finding in findings:
+        key = (finding["section"], finding["finding"].lower())
+        if key in seen or len(grouped[finding["section"]]) >= per_section:
+            continue
+        seen.add(key)
+        grouped[finding["section"]].append(finding)
+    return grouped
+
+def _activity_findings(activity_stats: Dict) -> List[Dict]:
+    """
+    Turns precomputed activity statistics into "Online Behavior" findings.
+    """
+    findings = []
+    if activity_stats.get("items_per_week") is not None:
+        findings.append({"section": "Online Behavior", "citation": ACTIVITY_CITATION,
+                         "finding": f"Frequency of Posting/Commenting: about {activity_stats['items_per_week']:.1f} "
+                                    f"comments and posts per week"})
+    if activity_stats.get("subreddits"):
+        names = ", ".join(f"r/{name}" for name, _ in activity_stats["subreddits"][:5])
+        findings.append({"section": "Online Behavior", "citation": ACTIVITY_CITATION,
+                         "finding": f"Subreddits Engaged In: {names}"})
+    return findings
+
+def merge_findings_locally(username: str, findings: List[Dict], activity_stats: Dict | None = None) -> str:
+    """
+    Renders findings into the persona template without another LLM call.
+
+    Args:
+        username (str): The Reddit username for the persona title.
+        findings (List[Dict]): Findings as returned by parse_findings.
+        activity_stats (Dict | None): Statistics from analytics.compute_activity_stats. If given,
+                                      they replace the model's posting frequency and subreddit findings.
+
+    Returns:
+        str: The persona in the same Markdown layout as generate_persona.
+    """
+    if activity_stats:
+        computed = _activity_findings(activity_stats)
+        replaced = tuple(finding["finding"].split(":", 1)[0] for finding in computed)
+        findings = computed + [finding for finding in findings
+                               if not (finding["section"] == "Online Behavior" and finding["finding"].startswith(replaced))]
+    lines = [f"### User Persona: {username}", ""]
+    for section, section_findings in group_findings(findings).items():
+        lines.append(f"**{section}:**")
+        if not section_findings:
+            lines.append("- Not enough information.")
+        elif section == "Quote":
+            quote = section_findings[0]
+            quote_text = quote["finding"].strip('"')
+            lines.append(f"\"{quote_text}\" (Citation: {quote['citation']})")
+        else:
+            bullet = "*" if section in ("Demographics", "Online Behavior") else "-"
+            for finding in section_findings:
+                lines.append(f"{bullet} {finding['finding']} (Citation: {finding['citation']})")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+def generate_persona_map_reduce(openai_api_key: str, user_content: List[ContentItem], username: str,
+                                client: OpenAI | None = None, raise_on_error: bool = False,
+                                cache: ResponseCache | None = None,
+                                chunk_token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                                max_workers: int = 4, merge: str = "llm",
+                                activity_stats: Dict | None = None) -> str:
+    """
+    Generates a persona for a large history by extracting findings from chunks in parallel.
+
+    The content is split into chunks of chunk_token_budget tokens, each chunk is sent to the
+    model concurrently for structured findings with citation URLs (map), and the findings are
+    then merged into the persona template (reduce), either by a final LLM call or locally.
+    Histories that fit into a single chunk are handed to generate_persona directly.
+
+    Args:
+        openai_api_key (str): Your OpenAI API key.
+        user_content (List[ContentItem]): Items as accepted by generate_persona.
+        username (str): The Reddit username for the persona title.
+        client (OpenAI | None): An existing OpenAI client to reuse.
+        raise_on_error (bool): Re-raise OpenAI API errors instead of returning an error persona.
+        cache (ResponseCache | None): Response cache used for the map and merge calls.
+        chunk_token_budget (int): Maximum tokens of user content per chunk.
+        max_workers (int): Maximum number of concurrent map calls.
+        merge (str): "llm" to merge findings with a final chat completion, "local" to render them directly.
+        activity_stats (Dict | None): Precomputed statistics, as accepted by generate_persona.
+
+    Returns:
+        str: The generated user persona in Markdown format.
+    """
+    if client is None:
+        if not openai_api_key:
+            raise ValueError("OPENAI_API_KEY is not set. Please configure it in your .env file.")
+        client = make_client(openai_api_key)
+
+    with get_metrics().stage("build_prompt", username=username, items=len(user_content)):
+        chunks = chunk_content(user_content, chunk_token_budget)
+    if len(chunks) <= 1:
+        return generate_persona(openai_api_key, user_content, username, client=client, raise_on_error=raise_on_error,
+                                cache=cache, content_token_budget=chunk_token_budget, activity_stats=activity_stats)
+
+    def extract(chunk: str) -> List[Dict]:
+        response_text = request_completion(client, build_extraction_prompt(chunk), cache=cache,
+                                           max_tokens=MAP_MAX_TOKENS, json_mode=True)
+        return parse_findings(response_text or "")
+
+    try:
+        print(f"Extracting persona findings from {len(chunks)} chunks in parallel...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            findings = [finding for chunk_findings in executor.map(extract, chunks) for finding in chunk_findings]
+        print(f"Extracted {len(findings)} findings.")
+
+        if not findings:
+            return f"### User Persona: {username}\n\nNo sufficient public content found to generate a persona."
+        if activity_stats is None:
+            activity_stats = compute_activity_stats(user_content)
+        if merge == "local":
+            return merge_findings_locally(username, findings, activity_stats)
+
+        findings_block = "".join(
+            f"- [{finding['section']}] {finding['finding']} ({finding['citation']})\n"
+            for section_findings in group_findings(findings).values() for finding in section_findings
+        )
+        print("Merging findings into the persona using OpenAI API...")
+        persona_content = request_completion(
+            client, build_persona_prompt(username, findings_block, "Findings Extracted from the User Content",
+                                         activity_block=format_activity_block(activity_stats)), cache=cache)
+        if persona_content:
+            print("Persona generated successfully by OpenAI API.")
+            return persona_content
+        print("OpenAI API returned an empty merge response; merging findings locally.")
+        return merge_findings_locally(username, findings, activity_stats)
+
+    except APIError as e:
+        print(f"OpenAI API Error: {e}")
+        if raise_on_error:
+            raise
         return f"### User Persona: {username}\n\nPersona generation failed due to OpenAI API error: {e}"
 
 if __name__ == "__main__":
@@ -131,10 +642,10 @@ if __name__ == "__main__":
 
     print("--- Testing persona_generator.py ---")
     sample_content = [
-        {"type": "comment", "text": "I really enjoy playing Elden Ring in my free time. It's a masterpiece!", "url": "https://reddit.com/r/Eldenring/comments/123"},
-        {"type": "post", "title": "Looking for recommendations for sci-fi books.", "text": "Just finished Dune and loved it. Any suggestions for similar epic space operas?", "url": "https://reddit.com/r/scifi/comments/456"},
-        {"type": "comment", "text": "Work has been pretty stressful lately, especially with all the deadlines.", "url": "https://reddit.com/r/jobs/comments/789"},
-        {"type": "comment", "text": "Always trying to learn new things, currently diving into Python.", "url": "https://reddit.com/r/learnprogramming/comments/012"}
+        ContentItem(type="comment", id="123", text="I really enjoy playing Elden Ring in my free time. It's a masterpiece!", url="https://reddit.com/r/Eldenring/comments/123"),
+        ContentItem(type="post", id="456", title="Looking for recommendations for sci-fi books.", text="Just finished Dune and loved it. Any suggestions for similar epic space operas?", url="https://reddit.com/r/scifi/comments/456"),
+        ContentItem(type="comment", id="789", text="Work has been pretty stressful lately, especially with all the deadlines.", url="https://reddit.com/r/jobs/comments/789"),
+        ContentItem(type="comment", id="012", text="Always trying to learn new things, currently diving into Python.", url="https://reddit.com/r/learnprogramming/comments/012")
     ]
     
     if DUMMY_OPENAI_API_KEY == "YOUR_OPENAI_API_KEY_HERE":
@@ -0,0 +1,156 @@
+import os
+import re
+import time
+from typing import List, Dict, Tuple
+from dotenv import load_dotenv
+
+from reddit_scraper import get_user_content
+from content_store import ContentStore, refresh_user_content
+from instrumentation import get_metrics
+from utils import preprocess_texts
+from content_item import ContentItem
+from dedup import dedup_items
+from analytics import compute_activity_stats
+
+# Items this much older than a saved persona are re-read when updating it. Its time is when the
+# previous run's scrape started, so this only absorbs clock skew between this machine and Reddit
+UPDATE_OVERLAP_SECONDS = 600
+
+def get_username_from_url(url: str) -> str | None:
+    """
+    Extracts the Reddit username from a given user profile URL.
+
+    Args:
+        url (str): The Reddit user profile URL.
+
+    Returns:
+        str | None: The extracted username or None if not found/invalid URL.
+    """
+    match = re.search(r"reddit\.com/user/([^/]+)", url)
+    if match:
+        return match.group(1)
+    return None
+
+def parse_username(entry: str) -> str | None:
+    """
+    Extracts a Reddit username from a batch input entry.
+
+    Accepts a full profile URL, a "u/username" or "/u/username" reference, or a bare username.
+
+    Args:
+        entry (str): One line of batch input.
+
+    Returns:
+        str | None: The extracted username or None if the entry is not a valid reference.
+    """
+    entry = entry.strip()
+    if "reddit.com/" in entry:
+        return get_username_from_url(entry)
+    match = re.fullmatch(r"/?(?:u/)?([A-Za-z0-9_-]{3,20})/?", entry)
+    if match:
+        return match.group(1)
+    return None
+
+def load_credentials() -> Dict[str, str] | None:
+    """
+    Loads API credentials from the environment (and the .env file, if present).
+
+    Returns:
+        Dict[str, str] | None: The credentials keyed by environment variable name,
+                               or None if any of them is missing.
+    """
+    load_dotenv()
+    names = ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT", "OPENAI_API_KEY"]
+    credentials = {name: os.getenv(name) for name in names}
+    if not all(credentials.values()):
+        return None
+    return credentials
+
+def prepare_user_content(comments: List[ContentItem], posts: List[ContentItem],
+                         dedup: bool = True) -> Tuple[List[ContentItem], Dict]:
+    """
+    Combines scraped comments and posts into the item list expected by generate_persona.
+
+    The items are not copied: each item's text is replaced in place by its cleaned form
+    (for posts without a body, the cleaned title).
+
+    Args:
+        comments (List[ContentItem]): Comments as returned by get_user_content.
+        posts (List[ContentItem]): Posts as returned by get_user_content.
+        dedup (bool): Collapse exact and near-duplicate items into their highest-scored copy.
+
+    Returns:
+        Tuple[List[ContentItem], Dict]: The comments followed by the posts (only the representatives
+                                        if dedup is set, with urls set on those that absorbed
+                                        duplicates), and the activity statistics of all of them,
+                                        computed before deduplication so reposts still count.
+    """
+    # Preprocessing here keeps URLs and punctuation for LLM context, only stripping Markdown
+    # noise and collapsing whitespace; all texts are cleaned in one batch call
+    all_user_content = comments + posts
+    with get_metrics().stage("prepare_user_content", items=len(all_user_content)):
+        # Use selftext if available, otherwise title
+        texts = preprocess_texts([item.text or item.title if item.type == "post" else item.text
+                                  for item in all_user_content], keep_context=True)
+        for item, text_content in zip(all_user_content, texts):
+            item.text = text_content
+    activity_stats = compute_activity_stats(all_user_content)
+    if dedup:
+        all_user_content = dedup_items(all_user_content)
+    return all_user_content, activity_stats
+
+def fetch_user_content(reddit, username: str, store: ContentStore | None = None, limit: int = 200,
+                       max_chars: int | None = None,
+                       max_age_days: float | None = None,
+                       raise_on_error: bool = False) -> Tuple[List[ContentItem], List[ContentItem]]:
+    """
+    Fetches a user's comments and posts, incrementally through the content store if one is given.
+
+    Args:
+        reddit (praw.Reddit): An initialized PRAW Reddit instance.
+        username (str): The Reddit username.
+        store (ContentStore | None): Local content store; None fetches everything from Reddit.
+        limit (int): The maximum number of top comments and posts to use.
+        max_chars (int | None): Character budget at which fetching stops early.
+        max_age_days (float | None): Ignore items older than this many days.
+        raise_on_error (bool): Re-raise fetch errors instead of returning empty lists.
+
+    Returns:
+        Tuple[List[ContentItem], List[ContentItem]]: (comments, posts) as returned by get_user_content.
+    """
+    if store is not None:
+        return refresh_user_content(reddit, store, username, limit=limit, max_chars=max_chars,
+                                    max_age_days=max_age_days, raise_on_error=raise_on_error)
+    return get_user_content(reddit, username, limit=limit, max_chars=max_chars, max_age_days=max_age_days,
+                            raise_on_error=raise_on_error)
+
+def fetch_new_user_content(reddit, username: str, since_utc: float, store: ContentStore | None = None,
+                           limit: int = 200, max_chars: int | None = None,
+                           raise_on_error: bool = False) -> Tuple[List[ContentItem], List[ContentItem]]:
+    """
+    Fetches only the comments and posts a user created after since_utc.
+
+    The "new" listings are paginated until the first older item. With a store that already
+    holds the user, it is refreshed incrementally and the newer items are read back from it;
+    a store that has never seen the user is bypassed, since its first fetch would only cover
+    the user's top items and miss new low-scored ones.
+
+    Args:
+        reddit (praw.Reddit): An initialized PRAW Reddit instance.
+        username (str): The Reddit username.
+        since_utc (float): Unix timestamp; older items are skipped.
+        store (ContentStore | None): Local content store; None fetches from Reddit directly.
+        limit (int): The maximum number of comments and of posts.
+        max_chars (int | None): Character budget at which fetching stops early.
+        raise_on_error (bool): Re-raise fetch errors instead of returning empty lists, which
+                               would read as "no new activity".
+
+    Returns:
+        Tuple[List[ContentItem], List[ContentItem]]: (comments, posts) as returned by get_user_content.
+    """
+    if store is not None and store.last_refresh(username) is not None:
+        refresh_user_content(reddit, store, username, limit=limit, max_chars=max_chars,
+                             raise_on_error=raise_on_error)
+        return store.get_user_content(username, limit=limit, max_age_days=(time.time() - since_utc) / 86400)
+    return get_user_content(reddit, username, limit=limit, sort="new", max_chars=max_chars, since_utc=since_utc,
+                            raise_on_error=raise_on_error)
@@ -0,0 +1,167 @@
+import math
+import time
+from typing import List, Tuple
+
+from content_item import ContentItem
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+DEFAULT_CONTENT_TOKEN_BUDGET = 8000 # Leaves room for the template and completion in a 16k context
+DEFAULT_MAX_ITEM_TOKENS = 400
+CHARS_PER_TOKEN = 4 # Rough average for English text when tiktoken is unavailable
+RECENCY_HALF_LIFE_DAYS = 180
+MIN_LINE_TOKENS = 16 # Smallest plausible "- Type: "text" (url)" line
+MAX_CITATION_URLS = 3 # Citation URLs shown for an item that absorbed duplicates
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens in text, exactly with tiktoken if installed, otherwise estimated from its length.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shortens text to at most max_tokens tokens, marking the cut with an ellipsis.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+def item_text(item: ContentItem) -> str:
+    """
+    Returns the text of a content item, using the title for posts without a body.
+    """
+    text = item.text
+    if item.type == "post" and not text:
+        text = item.title
+    return text.strip()
+
+def rank_score(item: ContentItem, now: float | None = None) -> float:
+    """
+    Scores how valuable an item is as persona evidence, from its Reddit score, recency and length.
+
+    Reddit score and length are log-scaled so a single viral comment or a wall of text does not
+    dominate; recency decays with a half-life of RECENCY_HALF_LIFE_DAYS. Items without a
+    timestamp are treated as neither recent nor old.
+    """
+    now = now if now is not None else time.time()
+    score = item.score or 0
+    score_part = math.copysign(math.log1p(abs(score)), score)
+    created_utc = item.created_utc
+    if created_utc:
+        age_days = max(0.0, (now - created_utc) / 86400)
+        recency_part = 2 * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    else:
+        recency_part = 1.0
+    length_part = math.log1p(len(item_text(item))) / 2
+    return score_part + recency_part + length_part
+
+def rank_items(user_content: List[ContentItem]) -> List[ContentItem]:
+    """
+    Returns the items ordered from most to least valuable according to rank_score.
+    """
+    now = time.time()
+    return sorted(user_content, key=lambda item: rank_score(item, now), reverse=True)
+
+def format_item_line(item: ContentItem, max_item_tokens: int = DEFAULT_MAX_ITEM_TOKENS) -> str | None:
+    """
+    Formats an item as a "- Type: "text" (url)" prompt line, or returns None if it has no text.
+    Items that absorbed duplicates list up to MAX_CITATION_URLS URLs, comma-separated.
+    """
+    text = item_text(item)
+    if not text: # Only add if there's actual text content
+        return None
+    content_type = item.type.capitalize()
+    urls = ", ".join(item.urls[:MAX_CITATION_URLS]) if item.urls else item.url
+    return f"- {content_type}: \"{truncate_to_tokens(text, max_item_tokens)}\" ({urls})\n"
+
+def build_content_block(user_content: List[ContentItem], token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                        max_item_tokens: int = DEFAULT_MAX_ITEM_TOKENS) -> Tuple[str, int]:
+    """
+    Packs the most valuable items into a token budget for the LLM prompt.
+
+    Items are ranked by rank_score, overlong bodies are truncated to max_item_tokens, and
+    lines are added in rank order while they fit; a line that does not fit is skipped so
+    smaller lower-ranked items can still fill the remaining budget. The block is assembled
+    with a single join.
+
+    Args:
+        user_content (List[ContentItem]): The items to choose from.
+        token_budget (int): Maximum number of tokens for the whole block.
+        max_item_tokens (int): Maximum number of tokens of body text per item.
+
+    Returns:
+        Tuple[str, int]: The content block (one "- Type: "text" (url)" line per item) and the
+                         number of items included.
+    """
+    lines = []
+    used = 0
+    for item in rank_items(user_content):
+        if token_budget - used < MIN_LINE_TOKENS:
+            break # No further item can fit
+        line = format_item_line(item, max_item_tokens)
+        if line is None:
+            continue
+        line_tokens = count_tokens(line)
+        if used + line_tokens > token_budget:
+            continue
+        lines.append(line)
+        used += line_tokens
+    return "".join(lines), len(lines)
+
+def chunk_content(user_content: List[ContentItem], chunk_token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                  max_item_tokens: int = DEFAULT_MAX_ITEM_TOKENS, max_chunks: int | None = None) -> List[str]:
+    """
+    Splits all items into content blocks of at most chunk_token_budget tokens each.
+
+    Items are taken in rank order and a new chunk is started whenever the next line would
+    overflow the current one, so the first chunks hold the most valuable evidence.
+
+    Args:
+        user_content (List[ContentItem]): Items as accepted by build_content_block.
+        chunk_token_budget (int): Maximum number of tokens per chunk.
+        max_item_tokens (int): Maximum number of tokens of body text per item.
+        max_chunks (int | None): Stop after this many chunks; None keeps every item.
+
+    Returns:
+        List[str]: The content blocks, most valuable first.
+    """
+    chunks = []
+    lines = []
+    used = 0
+    for item in rank_items(user_content):
+        line = format_item_line(item, min(max_item_tokens, chunk_token_budget - MIN_LINE_TOKENS))
+        if line is None:
+            continue
+        line_tokens = count_tokens(line)
+        if lines and used + line_tokens > chunk_token_budget:
+            chunks.append("".join(lines))
+            if max_chunks is not None and len(chunks) >= max_chunks:
+                return chunks
+            lines, used = [], 0
+        lines.append(line)
+        used += line_tokens
+    if lines:
+        chunks.append("".join(lines))
+    return chunks
@@ -0,0 +1,234 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Mapping
+
+import openai
+import prawcore
+
+from instrumentation import get_metrics
+
+DEFAULT_REDDIT_RPM = 100 # Reddit's OAuth quota per client id
+DEFAULT_OPENAI_RPM = 500
+DEFAULT_OPENAI_TPM = 200_000
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at per_minute tokens per minute.
+
+    Besides the configured rate, the bucket can be corrected from server-reported quota
+    (update) and paused entirely, e.g. after a 429 with Retry-After (pause).
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Blocks until amount tokens are available and takes them.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        amount = min(amount, self.capacity) # A single oversized request must still be able to run
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= amount:
+                        self.tokens -= amount
+                        return waited
+                    wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, remaining: float | None = None, reset_seconds: float | None = None) -> None:
+        """
+        Lowers the available tokens to what the server reports as remaining. When the server
+        reports nothing remaining, the bucket is paused until its reported reset.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset_seconds:
+                    self.paused_until = max(self.paused_until, time.monotonic() + reset_seconds)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for the given number of seconds.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def parse_reset_seconds(value: str | None) -> float | None:
+    """
+    Parses a rate-limit reset value such as "1s", "6m0s", "20ms" or a plain number of seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    return sum(float(number) * units[unit] for number, unit in parts) if parts else None
+
+def _retry_after(headers: Mapping | None) -> float | None:
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    return parse_reset_seconds(headers.get("retry-after"))
+
+def classify_error(error: Exception) -> tuple:
+    """
+    Decides whether an OpenAI or Reddit error is worth retrying.
+
+    Returns:
+        tuple: (retryable, retry_after_seconds or None, rate_limited)
+    """
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        return status in RETRYABLE_STATUS_CODES, _retry_after(error.response.headers), status == 429
+    if isinstance(error, openai.APIConnectionError): # Includes timeouts
+        return True, None, False
+    if isinstance(error, prawcore.exceptions.TooManyRequests):
+        return True, _retry_after(getattr(error.response, "headers", None)), True
+    if isinstance(error, prawcore.exceptions.ServerError):
+        return True, None, False
+    if isinstance(error, prawcore.exceptions.RequestException): # Network-level failure
+        return True, None, False
+    return False, None, False
+
+class RateLimitScheduler:
+    """
+    The central gatekeeper for Reddit and OpenAI calls.
+
+    Every call takes a token from its service's request bucket (and, for OpenAI, as many tokens
+    from the token-per-minute bucket as the request may consume) before it is made, so concurrent
+    batch workers share one quota. Buckets are corrected from rate-limit response headers, and
+    retryable errors are retried with jittered exponential backoff; a 429 pauses the whole
+    service so other workers back off too.
+    """
+
+    def __init__(self, reddit_rpm: float = DEFAULT_REDDIT_RPM, openai_rpm: float = DEFAULT_OPENAI_RPM,
+                 openai_tpm: float = DEFAULT_OPENAI_TPM, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Args:
+            reddit_rpm (float): Reddit requests per minute.
+            openai_rpm (float): OpenAI requests per minute.
+            openai_tpm (float): OpenAI tokens (prompt plus max completion) per minute.
+            max_retries (int): Retries per call before the error is raised.
+            base_delay (float): Backoff before the first retry, doubled for each further retry.
+            max_delay (float): Upper bound for a single backoff.
+        """
+        self.buckets: Dict[str, Dict[str, TokenBucket]] = {
+            "reddit": {"requests": TokenBucket(reddit_rpm)},
+            "openai": {"requests": TokenBucket(openai_rpm), "tokens": TokenBucket(openai_tpm)},
+        }
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Returns the delay before retry number attempt (0-based): full jitter over an exponentially
+        growing window, but never shorter than a server-provided Retry-After.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+    def call(self, service: str, func: Callable, *args, tokens: float = 0, acquire: bool = True, **kwargs):
+        """
+        Calls func(*args, **kwargs) within the service's quota, retrying retryable errors.
+
+        Args:
+            service (str): "reddit" or "openai".
+            func (Callable): The function making the request.
+            tokens (float): Tokens the request counts against the service's token quota.
+            acquire (bool): Whether this call makes a request at all (e.g. False for listing
+                            items PRAW serves from an already-fetched page).
+
+        Returns:
+            The return value of func.
+
+        Raises:
+            Exception: The last error, if it is not retryable or retries are exhausted.
+        """
+        metrics = get_metrics()
+        buckets = self.buckets[service]
+        for attempt in range(self.max_retries + 1):
+            if acquire:
+                waited = buckets["requests"].acquire(1)
+                if tokens and "tokens" in buckets:
+                    waited += buckets["tokens"].acquire(tokens)
+                if waited:
+                    metrics.incr("rate_limit_wait_seconds", waited, service=service)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                retryable, retry_after, rate_limited = classify_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                if rate_limited:
+                    buckets["requests"].pause(delay)
+                metrics.incr("retries", service=service, error=type(e).__name__)
+                print(f"{service} call failed ({type(e).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                if not rate_limited:
+                    time.sleep(delay)
+                acquire = True # A retry always makes a new request
+
+    def update_from_headers(self, service: str, headers: Mapping) -> None:
+        """
+        Corrects the service's buckets from rate-limit response headers.
+
+        OpenAI reports x-ratelimit-remaining-requests/-tokens and x-ratelimit-reset-requests/-tokens;
+        Reddit reports x-ratelimit-remaining and x-ratelimit-reset.
+        """
+        buckets = self.buckets[service]
+        if service == "openai":
+            for kind in ("requests", "tokens"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is not None:
+                    buckets[kind].update(float(remaining), parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}")))
+        else:
+            remaining = headers.get("x-ratelimit-remaining")
+            if remaining is not None:
+                buckets["requests"].update(float(remaining), parse_reset_seconds(headers.get("x-ratelimit-reset")))
+
+_scheduler = None
+
+def get_scheduler() -> RateLimitScheduler | None:
+    """
+    Returns the process-wide scheduler Reddit and OpenAI calls go through, or None if calls are unscheduled.
+    """
+    return _scheduler
+
+def set_scheduler(scheduler: RateLimitScheduler | None) -> RateLimitScheduler | None:
+    """
+    Installs (or, with None, removes) the process-wide scheduler.
+    """
+    global _scheduler
+    _scheduler = scheduler
+    return scheduler
@@ -1,5 +1,11 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import praw
-from typing import List, Dict, Tuple
+from typing import List, Tuple, Iterator
+from content_item import ContentItem
+from instrumentation import get_metrics
+from rate_limiter import get_scheduler
 
 def init_reddit_api(client_id: str, client_secret: str, user_agent: str) -> praw.Reddit:
     """
@@ -34,65 +40,218 @@ def init_reddit_api(client_id: str, client_secret: str, user_agent: str) -> praw
         print(f"An unexpected error occurred during Reddit API initialization: {e}")
         raise
 
-def get_user_content(reddit: praw.Reddit, username: str, limit: int = 100) -> Tuple[List[Dict], List[Dict]]:
+PAGE_SIZE = 100 # Items per listing request made by PRAW
+
+# Narrowest "top" time filter that still covers a given maximum age in days
+TOP_TIME_FILTERS = [(1, "day"), (7, "week"), (31, "month"), (365, "year")]
+
+class ContentBudget:
+    """
+    A thread-safe character budget shared by the comment and post listings of one user.
+
+    Each listing may use an equal share of max_chars; a listing that reaches its share waits
+    until the other listing finishes and then takes over whatever budget is left. Once the
+    combined text reaches max_chars, the budget is exhausted and all listings stop paginating.
+    """
+
+    def __init__(self, max_chars: int | None = None, listings: int = 2):
+        self.max_chars = max_chars
+        self.used = 0
+        self._share = max_chars / listings if max_chars is not None else None
+        self._used_by = {}
+        self._active = listings
+        self._cond = threading.Condition()
+
+    def exhausted(self) -> bool:
+        return self.max_chars is not None and self.used >= self.max_chars
+
+    def consume(self, listing: str, chars: int) -> bool:
+        """
+        Records chars of gathered text for a listing. Returns False if the budget is exhausted.
+        """
+        if self.max_chars is None:
+            return True
+        with self._cond:
+            self._cond.wait_for(lambda: self.exhausted() or self._active <= 1
+                                or self._used_by.get(listing, 0) < self._share)
+            if self.exhausted():
+                return False
+            self.used += chars
+            self._used_by[listing] = self._used_by.get(listing, 0) + chars
+            return True
+
+    def finish(self) -> None:
+        """
+        Marks one listing as finished so the remaining ones may use its unspent share.
+        """
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+def comment_to_item(comment) -> ContentItem:
+    return ContentItem(
+        type="comment",
+        id=comment.id,
+        text=comment.body,
+        url=f"https://reddit.com{comment.permalink}", # Full URL
+        subreddit=str(comment.subreddit), # Display name; needs no extra request
+        score=comment.score,
+        created_utc=comment.created_utc,
+    )
+
+def submission_to_item(submission) -> ContentItem:
+    return ContentItem(
+        type="post",
+        id=submission.id,
+        title=submission.title,
+        text=submission.selftext, # selftext can be empty for link posts
+        url=f"https://reddit.com{submission.permalink}", # Full URL
+        subreddit=str(submission.subreddit),
+        score=submission.score,
+        created_utc=submission.created_utc,
+    )
+
+def _listing(listing, sort: str, limit: int | None, max_age_days: float | None):
+    """
+    Returns PRAW's lazy ListingGenerator for the requested sort order.
+    For "top", the time filter is narrowed to the smallest window covering max_age_days.
+    """
+    if sort == "new":
+        return listing.new(limit=limit)
+    time_filter = "all"
+    if max_age_days is not None:
+        time_filter = next((name for days, name in TOP_TIME_FILTERS if max_age_days <= days), "all")
+    return listing.top(time_filter=time_filter, limit=limit)
+
+def _scheduled(listing) -> Iterator:
+    """
+    Yields from a PRAW listing, routing each page request through the shared rate-limit scheduler.
+
+    Only every PAGE_SIZE-th item triggers a request, so only those take a token from the Reddit
+    quota. A failed page request leaves PRAW's ListingGenerator where it was, so retrying the
+    same next() call requests that page again.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        yield from listing
+        return
+    iterator = iter(listing)
+    count = 0
+    while True:
+        try:
+            item = scheduler.call("reddit", next, iterator, acquire=count % PAGE_SIZE == 0)
+        except StopIteration:
+            return
+        count += 1
+        yield item
+
+def iter_user_comments(user, limit: int | None = 100, sort: str = "top", max_age_days: float | None = None) -> Iterator[ContentItem]:
+    """
+    Lazily yields a redditor's comments as ContentItems. Pages are only requested as the generator is consumed.
+    """
+    for comment in _scheduled(_listing(user.comments, sort, limit, max_age_days)):
+        yield comment_to_item(comment)
+
+def iter_user_posts(user, limit: int | None = 100, sort: str = "top", max_age_days: float | None = None) -> Iterator[ContentItem]:
+    """
+    Lazily yields a redditor's submissions as ContentItems. Pages are only requested as the generator is consumed.
+    """
+    for submission in _scheduled(_listing(user.submissions, sort, limit, max_age_days)):
+        yield submission_to_item(submission)
+
+def _collect(items: Iterator[ContentItem], budget: ContentBudget, cutoff_utc: float | None,
+             sort: str) -> List[ContentItem]:
+    """
+    Drains items until the listing ends, the shared budget is exhausted or, for the
+    "new" sort order, an item older than cutoff_utc is reached.
+    """
+    collected = []
+    try:
+        for item in items:
+            if cutoff_utc is not None and item.created_utc < cutoff_utc:
+                if sort == "new":
+                    break  # Everything after this item is older still
+                continue
+            if not budget.consume(item.type, len(item.text) + len(item.title)):
+                break
+            collected.append(item)
+    finally:
+        budget.finish()
+    return collected
+
+def get_user_content(reddit: praw.Reddit, username: str, limit: int | None = 100, sort: str = "top",
+                     max_chars: int | None = None, max_age_days: float | None = None,
+                     since_utc: float | None = None,
+                     raise_on_error: bool = False) -> Tuple[List[ContentItem], List[ContentItem]]:
     """
     Fetches a Reddit user's top comments and submissions (posts).
 
+    The comment and post listings are consumed concurrently as lazy generators, so both
+    paginate in parallel and stop requesting further pages as soon as a stop condition is met.
+
     Args:
         reddit (praw.Reddit): An initialized PRAW Reddit instance.
         username (str): The Reddit username to scrape.
-        limit (int): The maximum number of top comments and posts to fetch.
+        limit (int | None): The maximum number of top comments and posts to fetch. None fetches
+                            as many as the listing returns (Reddit serves up to 1000).
+        sort (str): Listing order, "top" (default) or "new".
+        max_chars (int | None): Stop fetching once this many characters of text have been
+                                gathered across comments and posts. None means no budget.
+        max_age_days (float | None): Ignore items older than this many days. With sort="new",
+                                     pagination stops at the first older item.
+        since_utc (float | None): Ignore items created before this Unix timestamp. Combined with
+                                  sort="new", this fetches only activity newer than a previous run.
+        raise_on_error (bool): Re-raise fetch errors (e.g. a nonexistent, suspended or forbidden
+                               user, or a network failure) instead of returning empty lists, so
+                               callers can tell them apart from a user without activity.
 
     Returns:
-        Tuple[List[Dict], List[Dict]]: A tuple containing two lists:
-            - comments (List[Dict]): List of dictionaries, each representing a comment.
-              Format: {"type": "comment", "text": comment_body, "url": permalink, "score": score}
-            - posts (List[Dict]): List of dictionaries, each representing a post.
-              Format: {"type": "post", "title": post_title, "text": post_selftext, "url": permalink, "score": score}
+        Tuple[List[ContentItem], List[ContentItem]]: A tuple containing two lists:
+            - comments (List[ContentItem]): Items with type "comment"; text is the comment body.
+            - posts (List[ContentItem]): Items with type "post"; title is the post title and
+              text its selftext.
 
-    Raises:
-        praw.exceptions.NotFound: If the user does not exist.
-        praw.exceptions.RedditorBlocked: If the redditor has blocked your application.
+    Raises (only with raise_on_error):
+        prawcore.exceptions.NotFound: If the user does not exist.
+        prawcore.exceptions.Forbidden: If the user is suspended or the content is not accessible.
         praw.exceptions.ClientException: For other PRAW-related client errors.
         Exception: For any other unexpected errors during content fetching.
     """
-    comments = []
-    posts = []
+    metrics = get_metrics()
+    budget = ContentBudget(max_chars)
+    cutoff_utc = time.time() - max_age_days * 86400 if max_age_days is not None else None
+    if since_utc is not None:
+        cutoff_utc = max(cutoff_utc or since_utc, since_utc)
 
     try:
         user = reddit.redditor(username)
 
-        print(f"Fetching top {limit} comments for u/{username}...")
-        for comment in user.comments.top(limit=limit):
-            comments.append({
-                "type": "comment",
-                "text": comment.body,
-                "url": f"https://reddit.com{comment.permalink}", # Full URL
-                "score": comment.score
-            })
-            # Add a small delay to respect rate limits if fetching many items
-            # time.sleep(0.1)
-
-        print(f"Fetching top {limit} posts for u/{username}...")
-        for submission in user.submissions.top(limit=limit):
-            posts.append({
-                "type": "post",
-                "title": submission.title,
-                "text": submission.selftext, # selftext can be empty for link posts
-                "url": f"https://reddit.com{submission.permalink}", # Full URL
-                "score": submission.score
-            })
-            # Add a small delay to respect rate limits if fetching many items
-            # time.sleep(0.1)
+        print(f"Fetching {sort} {limit if limit is not None else 'all'} comments and posts for u/{username}...")
+        with metrics.stage("fetch_user_content", username=username, sort=sort), \
+             ThreadPoolExecutor(max_workers=2) as executor:
+            comments_future = executor.submit(
+                _collect, iter_user_comments(user, limit, sort, max_age_days), budget, cutoff_utc, sort)
+            posts_future = executor.submit(
+                _collect, iter_user_posts(user, limit, sort, max_age_days), budget, cutoff_utc, sort)
+            comments = comments_future.result()
+            posts = posts_future.result()
+        metrics.incr("reddit_items_fetched", len(comments), type="comment")
+        metrics.incr("reddit_items_fetched", len(posts), type="post")
 
         print(f"Fetched {len(comments)} comments and {len(posts)} posts for u/{username}.")
         return comments, posts
 
     except praw.exceptions.ClientException as e:
         print(f"Error fetching content (PRAW Client Exception): {e}")
+        metrics.incr("reddit_fetch_errors")
+        if raise_on_error:
+            raise
         return [], []
     except Exception as e:
         print(f"An unexpected error occurred while fetching Reddit content: {e}")
+        metrics.incr("reddit_fetch_errors")
+        if raise_on_error:
+            raise
         return [], []
 
 if __name__ == "__main__":
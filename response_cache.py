@@ -0,0 +1,121 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_utc REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_age ON responses (created_utc);
+"""
+
+def make_cache_key(model: str, temperature: float, max_tokens: int, system_prompt: str, llm_prompt: str) -> str:
+    """
+    Builds a content-addressed cache key for a chat completion request.
+
+    Args:
+        model (str): The OpenAI model name.
+        temperature (float): Sampling temperature.
+        max_tokens (int): Completion token limit.
+        system_prompt (str): The system message.
+        llm_prompt (str): The assembled user prompt.
+
+    Returns:
+        str: A SHA-256 hex digest that changes whenever any request parameter changes.
+    """
+    payload = json.dumps([model, temperature, max_tokens, system_prompt, llm_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache of LLM responses with age-based expiry and optional SQLite persistence.
+
+    Entries live in memory up to max_entries (least recently used are evicted first) and
+    expire after max_age_seconds. With a path, entries are also written to disk so that
+    reruns and crash restarts can reuse responses from earlier processes.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int = 10000,
+                 max_age_seconds: float | None = 30 * 86400):
+        """
+        Args:
+            path (str | None): SQLite file for persistence, or None for an in-memory cache only.
+            max_entries (int): Maximum number of entries kept (in memory and on disk).
+            max_age_seconds (float | None): Entries older than this are treated as missing. None disables expiry.
+        """
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, created_utc)
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def _expired(self, created_utc: float) -> bool:
+        return self.max_age_seconds is not None and time.time() - created_utc > self.max_age_seconds
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT response, created_utc FROM responses WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = (row[0], row[1])
+                    self._entries[key] = entry
+                    self._evict_memory()
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Stores a response under key, evicting the oldest entries if the cache is full.
+        """
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (response, now)
+            self._entries.move_to_end(key)
+            self._evict_memory()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO responses (key, response, created_utc) VALUES (?, ?, ?)",
+                                       (key, response, now))
+                    if self.max_age_seconds is not None:
+                        self._conn.execute("DELETE FROM responses WHERE created_utc < ?", (now - self.max_age_seconds,))
+                    self._conn.execute(
+                        """DELETE FROM responses WHERE key IN (
+                               SELECT key FROM responses ORDER BY created_utc DESC LIMIT -1 OFFSET ?)""",
+                        (self.max_entries,))
+
+    def _evict_memory(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,178 @@
+import heapq
+import math
+from array import array
+from collections import Counter
+from operator import itemgetter
+from typing import List, Dict, Tuple
+
+from content_item import ContentItem
+from dedup import normalize_words
+from instrumentation import get_metrics
+from prompt_builder import (count_tokens, format_item_line, item_text, rank_items,
+                            DEFAULT_CONTENT_TOKEN_BUDGET, DEFAULT_MAX_ITEM_TOKENS)
+
+DEFAULT_SECTION_K = 8 # Items retrieved per persona section
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Query terms per persona section. Sections without a query ("Online Behavior", which the
+# activity statistics cover, and "Quote") take the user's highest-ranked remaining items.
+SECTION_QUERIES = {
+    "Demographics": "age old years birthday born wife husband girlfriend boyfriend married kids son daughter "
+                    "mom dad parents family live living city country moved town job work working student college "
+                    "university school degree career retired",
+    "Behavior & Habits": "every day daily usually always often routine weekend weekends morning night play playing "
+                         "watch watching read reading gym cook cooking habit hobby spend",
+    "Frustrations": "hate hated annoying annoyed frustrating frustrated problem problems issue issues broken worst "
+                    "tired sick stress stressful bug bugs terrible awful ridiculous complain",
+    "Goals & Needs": "want wanted need needs goal goals plan planning hope hoping trying try looking learn learning "
+                     "save saving improve advice recommend recommendations help",
+    "Motivations": "love loved enjoy enjoying passion passionate because inspired care important fun favorite "
+                   "excited proud worth",
+    "Personality Traits": "think honestly feel feeling opinion personally agree disagree introvert extrovert anxious "
+                          "patient lol admit myself",
+    "Online Behavior": "",
+    "Quote": "",
+}
+
+class BM25Index:
+    """
+    An in-memory inverted index over tokenized documents, scored with Okapi BM25.
+
+    Only the postings of the query's terms are visited, so a search costs time proportional
+    to how often those terms occur rather than to the number of documents.
+    """
+
+    def __init__(self, documents: List[List[str]], k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Args:
+            documents (List[List[str]]): The documents' terms, e.g. from dedup.normalize_words.
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+        """
+        self.k1 = k1
+        self.postings = {} # term -> [(doc_id, term frequency)]
+        lengths = array("I", map(len, documents))
+        for doc_id, terms in enumerate(documents):
+            for term, frequency in Counter(terms).items():
+                self.postings.setdefault(term, []).append((doc_id, frequency))
+        self.size = len(documents)
+        average_length = (sum(lengths) / len(lengths)) if documents else 0
+        # The length-dependent part of the BM25 denominator, precomputed per document
+        self._norms = array("d", (k1 * (1 - b + b * length / average_length) if average_length else k1
+                                  for length in lengths))
+
+    def idf(self, term: str) -> float:
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (self.size - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query_terms: List[str], k: int = DEFAULT_SECTION_K) -> List[Tuple[int, float]]:
+        """
+        Returns up to k (doc_id, score) pairs for the documents best matching the query, best first.
+        """
+        scores = {}
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, frequency in postings:
+                scores[doc_id] = scores.get(doc_id, 0.0) + \
+                    idf * frequency * (self.k1 + 1) / (frequency + self._norms[doc_id])
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+def document_words(item: ContentItem) -> List[str]:
+    """
+    Tokenizes an item for the index: its text, preceded by the title for posts with a body.
+
+    Link posts carry only a title, which item_text (and prepare_user_content) already uses as
+    their text, so it is not indexed a second time.
+    """
+    words = normalize_words(item_text(item))
+    if item.title and item.text:
+        title_words = normalize_words(item.title)
+        if title_words != words:
+            words = title_words + words
+    return words
+
+def retrieve_section_evidence(user_content: List[ContentItem],
+                              k: int = DEFAULT_SECTION_K) -> Dict[str, List[ContentItem]]:
+    """
+    Picks the top-k items for each persona section.
+
+    Sections with a query get their best BM25 matches; each item is assigned to the first
+    section that retrieves it, so no item is repeated. Sections without a query then take
+    the highest-ranked items not assigned yet.
+
+    Args:
+        user_content (List[ContentItem]): Items as accepted by generate_persona.
+        k (int): Maximum items per section.
+
+    Returns:
+        Dict[str, List[ContentItem]]: Items per section, in SECTION_QUERIES order.
+    """
+    index = BM25Index([document_words(item) for item in user_content])
+    assigned = set()
+    evidence = {}
+    for section, query in SECTION_QUERIES.items():
+        if not query:
+            continue
+        # Search a little deeper than k, since some hits may already belong to another section
+        hits = [doc_id for doc_id, _ in index.search(query.split(), 2 * k) if doc_id not in assigned][:k]
+        assigned.update(hits)
+        evidence[section] = [user_content[doc_id] for doc_id in hits]
+    unassigned = [item for doc_id, item in enumerate(user_content) if doc_id not in assigned]
+    ranked = iter(rank_items(unassigned))
+    for section, query in SECTION_QUERIES.items():
+        if not query:
+            evidence[section] = [item for _, item in zip(range(k), ranked)]
+    return {section: evidence[section] for section in SECTION_QUERIES}
+
+def build_retrieval_block(user_content: List[ContentItem], k: int = DEFAULT_SECTION_K,
+                          token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET,
+                          max_item_tokens: int = DEFAULT_MAX_ITEM_TOKENS) -> Tuple[str, int]:
+    """
+    Builds a compact content block with only the evidence relevant to each persona section.
+
+    Args:
+        user_content (List[ContentItem]): Items as accepted by generate_persona.
+        k (int): Maximum items per section.
+        token_budget (int): Maximum number of tokens for the whole block, shared equally by the sections.
+        max_item_tokens (int): Maximum number of tokens of body text per item.
+
+    Returns:
+        Tuple[str, int]: The block, with the evidence under one "Evidence for <section>:" heading
+                         per section, and the number of items included.
+    """
+    with get_metrics().stage("retrieve_evidence", items=len(user_content)):
+        evidence = retrieve_section_evidence(user_content, k)
+    section_budget = token_budget // len(evidence)
+    parts = []
+    included = 0
+    for section, items in evidence.items():
+        heading = f"*Evidence for {section}:*\n"
+        lines = []
+        used = count_tokens(heading)
+        for item in items:
+            line = format_item_line(item, max_item_tokens)
+            if line is None:
+                continue
+            line_tokens = count_tokens(line)
+            if used + line_tokens > section_budget:
+                continue
+            lines.append(line)
+            used += line_tokens
+        if lines:
+            parts.append(heading + "".join(lines))
+            included += len(lines)
+    return "\n".join(parts), included
+
+if __name__ == "__main__":
+    sample_content = [
+        ContentItem(type="comment", id="123", text="I really enjoy playing Elden Ring in my free time. It's a masterpiece!", url="https://reddit.com/r/Eldenring/comments/123"),
+        ContentItem(type="post", id="456", title="Looking for recommendations for sci-fi books.", text="Just finished Dune and loved it. Any suggestions for similar epic space operas?", url="https://reddit.com/r/scifi/comments/456"),
+        ContentItem(type="comment", id="789", text="Work has been pretty stressful lately, especially with all the deadlines.", url="https://reddit.com/r/jobs/comments/789"),
+        ContentItem(type="comment", id="012", text="Always trying to learn new things, currently diving into Python.", url="https://reddit.com/r/learnprogramming/comments/012")
+    ]
+    block, included = build_retrieval_block(sample_content, k=2)
+    print(block)
@@ -1,81 +1,232 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 import os
-from dotenv import load_dotenv
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from reddit_scraper import init_reddit_api, get_user_content
-from persona_generator import generate_persona
-from utils import save_persona_to_file
+from persona_generator import stream_persona, make_client
+from rate_limiter import RateLimitScheduler, set_scheduler
+from output_sink import OutputSink
+from pipeline import prepare_user_content, load_credentials, parse_username
+
+GUI_WORKERS = 2 # Jobs processed at the same time
+POLL_INTERVAL_MS = 100
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job's worker thread once the user has cancelled the job.
+    """
 
 # Helper to run the persona generation pipeline
-def run_persona(username, status_callback):
-    load_dotenv()
-    REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
-    REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
-    REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+def run_persona(username, status_callback, reddit, openai_client, sink, cancel_event=None):
+    """
+    Runs the pipeline for one user with already initialized clients.
+
+    Cancellation is checked between stages and after every streamed piece of the persona;
+    a Reddit fetch already in progress is allowed to finish first.
 
-    if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, OPENAI_API_KEY]):
-        status_callback("Error: Missing one or more environment variables. Check your .env file.")
-        return
+    Returns:
+        str: The final status message for the job.
+    """
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
 
     try:
-        status_callback(f"Initializing Reddit API...")
-        reddit = init_reddit_api(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT)
-        if not reddit:
-            status_callback("Failed to initialize Reddit API.")
-            return
         status_callback(f"Fetching content for u/{username}...")
-        comments, posts = get_user_content(reddit, username, limit=200)
+        scraped_utc = time.time() # The persona covers activity up to here
+        comments, posts = get_user_content(reddit, username, limit=200, raise_on_error=True)
+        check_cancelled()
         if not comments and not posts:
-            status_callback(f"No public comments or posts found for u/{username}.")
-            return
-        all_user_content = []
-        for comment in comments:
-            all_user_content.append({"type": "comment", "text": comment["text"], "url": comment["url"]})
-        for post in posts:
-            text_content = post["text"] if post["text"] else post["title"]
-            all_user_content.append({"type": "post", "text": text_content, "url": post["url"], "title": post["title"]})
+            return f"No public comments or posts found for u/{username}."
+        all_user_content, activity_stats = prepare_user_content(comments, posts)
+        check_cancelled()
         status_callback("Generating persona using OpenAI API...")
-        persona_content = generate_persona(OPENAI_API_KEY, all_user_content, username)
-        if persona_content:
-            save_persona_to_file(username, persona_content)
-            status_callback(f"Persona generation complete! Saved as {username}_persona.txt")
-        else:
-            status_callback("Persona generation failed or returned empty.")
+        progress = {"chars": 0, "section": "", "tail": ""}
+        def on_chunk(chunk):
+            check_cancelled()
+            # Report progress as the persona streams in, naming the section being written.
+            # Only the tail of the text is kept, since a section header may span two chunks.
+            text = progress["tail"] + chunk
+            sections = re.findall(r"\*\*([^*\n]+):\*\*", text)
+            if sections:
+                progress["section"] = f" - writing {sections[-1]}"
+            progress["chars"] += len(chunk)
+            progress["tail"] = text[-64:]
+            status_callback(f"Generating persona... {progress['chars']} characters received{progress['section']}")
+        chunks = stream_persona(None, all_user_content, username, client=openai_client, activity_stats=activity_stats)
+        path = sink.stream(username, chunks, on_chunk=on_chunk, generated_utc=scraped_utc)
+        if path:
+            return f"Persona generation complete! Saved as {path}"
+        check_cancelled()
+        return f"Persona generation failed. Any partial output is in {sink.path_for(username)}.part"
+    except JobCancelled:
+        part_filename = sink.path_for(username) + ".part"
+        if os.path.exists(part_filename):
+            os.remove(part_filename)
+        return "Cancelled."
     except Exception as e:
-        status_callback(f"An error occurred: {e}")
+        return f"An error occurred: {e}"
+
+class PersonaSession:
+    """
+    Runs persona jobs for the GUI on a worker pool, sharing one Reddit and one OpenAI client.
+
+    The clients are initialized once, by the first job. Workers never touch Tk: they post
+    (job_id, message, final) status updates to the events queue, which the GUI drains on its own
+    thread. Every job ends with exactly one final update; anything posted for it later is stale.
+    """
+
+    def __init__(self, workers: int = GUI_WORKERS):
+        self.events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._jobs = {} # job_id -> (future, cancel event)
+        self._next_id = 0
+        self._clients = None
+        self._clients_lock = threading.Lock()
+        self.sink = OutputSink(".")
+
+    def _get_clients(self):
+        with self._clients_lock:
+            if self._clients is None:
+                credentials = load_credentials()
+                if not credentials:
+                    raise RuntimeError("Missing one or more environment variables. Check your .env file.")
+                reddit = init_reddit_api(credentials["REDDIT_CLIENT_ID"], credentials["REDDIT_CLIENT_SECRET"],
+                                         credentials["REDDIT_USER_AGENT"])
+                self._clients = (reddit, make_client(credentials["OPENAI_API_KEY"]))
+            return self._clients
+
+    def _run(self, job_id: int, username: str, cancel_event: threading.Event) -> None:
+        def status_callback(message):
+            self.events.put((job_id, message, False))
+        try:
+            if cancel_event.is_set():
+                message = "Cancelled."
+            else:
+                status_callback("Initializing API clients...")
+                reddit, openai_client = self._get_clients()
+                message = run_persona(username, status_callback, reddit, openai_client, self.sink, cancel_event)
+        except Exception as e:
+            message = f"An error occurred: {e}"
+        self.events.put((job_id, message, True))
+
+    def submit(self, username: str) -> int:
+        """
+        Queues a persona job for username and returns its job id.
+        """
+        job_id = self._next_id
+        self._next_id += 1
+        cancel_event = threading.Event()
+        self._jobs[job_id] = (self._executor.submit(self._run, job_id, username, cancel_event), cancel_event)
+        return job_id
+
+    def cancel(self, job_id: int) -> None:
+        """
+        Cancels a job: a queued job never starts, a running one stops at its next checkpoint.
+        """
+        future, cancel_event = self._jobs[job_id]
+        if future.done():
+            return
+        cancel_event.set()
+        if future.cancel():
+            # The job never started, so no worker will post its final update
+            self.events.put((job_id, "Cancelled.", True))
+        elif future.running():
+            self.events.put((job_id, "Cancelling...", False))
+
+    def shutdown(self) -> None:
+        """
+        Cancels all jobs and closes the sink once the running ones have stopped.
+
+        Blocks until then: a running job stops at its next checkpoint, which may be the end
+        of a Reddit fetch.
+        """
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.sink.close()
 
 # GUI setup
 def main():
+    set_scheduler(RateLimitScheduler()) # Concurrent jobs share the API quotas
+    session = PersonaSession()
+
     root = tk.Tk()
     root.title("Reddit Persona Generator")
-    root.geometry("400x200")
+    root.geometry("560x360")
 
-    tk.Label(root, text="Enter Reddit Username:").pack(pady=10)
+    tk.Label(root, text="Enter Reddit Username(s):").pack(pady=(10, 5))
+    input_frame = tk.Frame(root)
+    input_frame.pack()
     username_var = tk.StringVar()
-    entry = tk.Entry(root, textvariable=username_var, width=30)
-    entry.pack(pady=5)
+    entry = tk.Entry(input_frame, textvariable=username_var, width=40)
+    entry.pack(side=tk.LEFT, padx=5)
     entry.focus()
 
-    status_var = tk.StringVar()
-    status_label = tk.Label(root, textvariable=status_var, wraplength=380, fg="blue")
-    status_label.pack(pady=10)
+    jobs = ttk.Treeview(root, columns=("user", "status"), show="headings", height=10)
+    jobs.heading("user", text="User")
+    jobs.heading("status", text="Status")
+    jobs.column("user", width=130, stretch=False)
+    jobs.column("status", width=400)
+    jobs.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-    def on_generate():
-        username = username_var.get().strip()
-        if not username:
+    def on_generate(event=None):
+        # Several usernames or profile URLs may be entered at once, separated by spaces or commas
+        entries = username_var.get().replace(",", " ").split()
+        if not entries:
             messagebox.showerror("Input Error", "Please enter a Reddit username.")
             return
-        status_var.set("")
-        root.update()
-        def update_status(msg):
-            status_var.set(msg)
-            root.update()
-        run_persona(username, update_status)
+        invalid = []
+        for text in entries:
+            username = parse_username(text)
+            if not username:
+                invalid.append(text)
+                continue
+            job_id = session.submit(username)
+            jobs.insert("", tk.END, iid=str(job_id), values=(f"u/{username}", "Queued"))
+        username_var.set("")
+        if invalid:
+            messagebox.showerror("Input Error", f"Not a valid Reddit username: {', '.join(invalid)}")
+
+    def on_cancel():
+        for iid in jobs.selection():
+            session.cancel(int(iid))
+
+    finished = set()
+
+    def poll_events():
+        # Apply only the latest update per job; a streaming job may post many between polls.
+        # A "Cancelling..." racing with the job's end may arrive after its final update and is dropped.
+        latest = {}
+        try:
+            while True:
+                job_id, message, final = session.events.get_nowait()
+                if job_id in finished:
+                    continue
+                latest[job_id] = message
+                if final:
+                    finished.add(job_id)
+        except queue.Empty:
+            pass
+        for job_id, message in latest.items():
+            jobs.set(str(job_id), "status", message)
+        root.after(POLL_INTERVAL_MS, poll_events)
+
+    def on_close():
+        root.destroy() # Close the window right away; shutting down waits for running jobs
+        session.shutdown()
 
-    tk.Button(root, text="Generate Persona", command=on_generate).pack(pady=10)
+    tk.Button(input_frame, text="Generate Persona", command=on_generate).pack(side=tk.LEFT)
+    entry.bind("<Return>", on_generate)
+    tk.Button(root, text="Cancel Selected", command=on_cancel).pack(pady=(0, 10))
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.after(POLL_INTERVAL_MS, poll_events)
 
     root.mainloop()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
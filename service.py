@@ -0,0 +1,340 @@
+"""
+Long-running persona service.
+
+Keeps one warm PRAW instance and one pooled OpenAI client for the lifetime of the process and
+accepts persona jobs over a local HTTP/JSON API. Jobs wait in a bounded in-process queue and are
+processed by a fixed number of worker threads.
+
+Endpoints:
+    POST /jobs               {"username": "<name or profile URL>", "map_reduce": false}
+                             -> 202 {"id": ..., "status": "queued", ...}; 429 if the queue is full
+    GET  /jobs/<id>          Job status and timings.
+    GET  /jobs/<id>/result   The persona as text/markdown once the job is done.
+    GET  /metrics            Run metrics in Prometheus text format.
+    GET  /health             Liveness and queue depth.
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8080] [--workers 4] [--queue-size 100]
+"""
+import argparse
+import json
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from pipeline import load_credentials, parse_username, fetch_user_content, prepare_user_content
+from reddit_scraper import init_reddit_api
+from content_store import ContentStore
+from persona_generator import generate_persona, generate_persona_map_reduce, make_client
+from prompt_builder import DEFAULT_CONTENT_TOKEN_BUDGET
+from response_cache import ResponseCache
+from rate_limiter import (RateLimitScheduler, set_scheduler, DEFAULT_REDDIT_RPM,
+                          DEFAULT_OPENAI_RPM, DEFAULT_OPENAI_TPM)
+from instrumentation import get_metrics
+from output_sink import OutputSink
+
+MAX_FINISHED_JOBS = 1000 # Finished jobs kept for status queries; older ones are forgotten
+MAX_REQUEST_BYTES = 64 * 1024
+
+class PersonaService:
+    """
+    Runs persona jobs on a fixed pool of worker threads sharing one Reddit and one OpenAI client.
+
+    Submitting a user who already has a queued or running job returns that job instead of
+    queueing a second one. Job records hold the persona's file path, not its text, so memory
+    stays bounded by the queue size and MAX_FINISHED_JOBS. Finished personas are handed to the
+    sink's background writer, and a job is "saving" until its file is in place.
+    """
+
+    def __init__(self, reddit, openai_client, workers: int = 4, queue_size: int = 100, output_dir: str = ".",
+                 limit: int = 200, store: ContentStore | None = None, cache: ResponseCache | None = None,
+                 token_budget: int = DEFAULT_CONTENT_TOKEN_BUDGET, sink: OutputSink | None = None):
+        """
+        Args:
+            reddit (praw.Reddit): A shared, initialized PRAW Reddit instance.
+            openai_client (OpenAI): A shared OpenAI client.
+            workers (int): Number of jobs processed concurrently.
+            queue_size (int): Maximum number of jobs waiting; further submissions are rejected.
+            output_dir (str): Directory the persona files are written to, if no sink is given.
+            limit (int): The maximum number of top comments and posts to fetch per user.
+            store (ContentStore | None): Local content store used for incremental refreshes.
+            cache (ResponseCache | None): LLM response cache shared by all workers.
+            token_budget (int): Maximum tokens of user content per persona prompt.
+            sink (OutputSink | None): Where the personas are written; by default, flat into output_dir.
+        """
+        self.reddit = reddit
+        self.openai_client = openai_client
+        self.output_dir = output_dir
+        self.limit = limit
+        self.store = store
+        self.cache = cache
+        self.token_budget = token_budget
+        self.sink = sink if sink is not None else OutputSink(output_dir)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict() # id -> job, oldest first
+        self._active = {} # lowercased username -> id of its queued or running job
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._work, daemon=True, name=f"persona-worker-{i}")
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, username: str, map_reduce: bool = False) -> Dict:
+        """
+        Queues a persona job for username.
+
+        If the user already has a queued or running job, that job is returned instead. Usernames
+        are compared case-insensitively, as Reddit (and the content store and sink) treat them.
+
+        Returns:
+            Dict: A snapshot of the new (or already active) job.
+
+        Raises:
+            queue.Full: If the queue is full.
+        """
+        with self._lock:
+            active_id = self._active.get(username.lower())
+            if active_id is not None:
+                return dict(self._jobs[active_id])
+            job = {"id": uuid.uuid4().hex[:12], "username": username, "map_reduce": map_reduce, "status": "queued",
+                   "submitted_utc": time.time(), "started_utc": None, "finished_utc": None,
+                   "path": None, "error": None, "timings": {}}
+            self._queue.put_nowait(job["id"])
+            self._jobs[job["id"]] = job
+            self._active[username.lower()] = job["id"]
+            self._forget_finished()
+            get_metrics().incr("service_jobs_submitted")
+            return dict(job)
+
+    def get(self, job_id: str) -> Dict | None:
+        """
+        Returns a snapshot of a job, or None if it is unknown or has been forgotten.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, timings=dict(job["timings"])) if job else None
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _update(self, job: Dict, **fields) -> None:
+        with self._lock:
+            job.update(fields)
+
+    def _finish(self, job: Dict, status: str, **fields) -> None:
+        with self._lock:
+            job.update(fields, status=status, finished_utc=time.time())
+            self._active.pop(job["username"].lower(), None)
+        get_metrics().incr("service_jobs", status=status)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs[job_id]
+                job["status"], job["started_utc"] = "running", time.time()
+            try:
+                self._process(job)
+            except Exception as e:
+                self._finish(job, "failed", error=f"Persona generation failed: {e}")
+
+    def _process(self, job: Dict) -> None:
+        username = job["username"]
+        timings = job["timings"]
+        start = time.perf_counter()
+        scraped_utc = time.time() # The persona covers activity up to here
+        try:
+            comments, posts = fetch_user_content(self.reddit, username, store=self.store, limit=self.limit,
+                                                 raise_on_error=True)
+        except Exception as e:
+            self._finish(job, "failed", error=f"Scraping failed: {e}")
+            return
+        finally:
+            timings["scrape"] = time.perf_counter() - start
+        if not comments and not posts:
+            self._finish(job, "failed", error="No public comments or posts found.")
+            return
+        start = time.perf_counter()
+        all_user_content, activity_stats = prepare_user_content(comments, posts)
+        timings["prepare"] = time.perf_counter() - start
+        start = time.perf_counter()
+        if job["map_reduce"]:
+            persona_content = generate_persona_map_reduce(None, all_user_content, username, client=self.openai_client,
+                                                          raise_on_error=True, cache=self.cache,
+                                                          chunk_token_budget=self.token_budget,
+                                                          activity_stats=activity_stats)
+        else:
+            persona_content = generate_persona(None, all_user_content, username, client=self.openai_client,
+                                               raise_on_error=True, cache=self.cache,
+                                               content_token_budget=self.token_budget,
+                                               activity_stats=activity_stats)
+        timings["generate"] = time.perf_counter() - start
+        if not persona_content:
+            self._finish(job, "failed", error="Persona generation returned empty.")
+            return
+        self._update(job, status="saving")
+        start = time.perf_counter()
+
+        def saved(write) -> None:
+            with self._lock:
+                timings["save"] = time.perf_counter() - start
+            if write.result():
+                self._finish(job, "done", path=write.result())
+            else:
+                self._finish(job, "failed", error="Could not save persona file.")
+
+        # The worker moves on to the next job while the writer thread saves this one
+        self.sink.write(username, persona_content, scraped_utc).add_done_callback(saved)
+
+    def shutdown(self) -> None:
+        """
+        Lets the workers finish their current jobs and stop. Jobs still queued are not run.
+        """
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.sink.close()
+
+def make_handler(service: PersonaService):
+    """
+    Builds the HTTP request handler class bound to a PersonaService.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: str, content_type: str = "application/json") -> None:
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, status: int, payload: Dict) -> None:
+            self._send(status, json.dumps(payload))
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/health":
+                self._send_json(200, {"status": "ok", "queued": service.queued()})
+            elif path == "/metrics":
+                self._send(200, get_metrics().to_prometheus(), "text/plain; version=0.0.4")
+            elif match := re.fullmatch(r"/jobs/([0-9a-f]+)(/result)?", path):
+                job = service.get(match.group(1))
+                if job is None:
+                    self._send_json(404, {"error": "Unknown job."})
+                elif not match.group(2):
+                    self._send_json(200, job)
+                elif job["status"] != "done":
+                    self._send_json(409, {"error": f"Job is {job['status']}.", "status": job["status"]})
+                else:
+                    try:
+                        with open(job["path"], "r", encoding="utf-8") as f:
+                            self._send(200, f.read(), "text/markdown")
+                    except OSError as e:
+                        self._send_json(500, {"error": f"Could not read persona file: {e}"})
+            else:
+                self._send_json(404, {"error": "Not found."})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                self._send_json(404, {"error": "Not found."})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_REQUEST_BYTES:
+                self._send_json(413, {"error": "Request body too large."})
+                return
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "Request body must be JSON."})
+                return
+            username = parse_username(str(request.get("username", ""))) if isinstance(request, dict) else None
+            if not username:
+                self._send_json(400, {"error": "Provide a valid Reddit username or profile URL as 'username'."})
+                return
+            try:
+                job = service.submit(username, map_reduce=bool(request.get("map_reduce", False)))
+            except queue.Full:
+                self._send_json(429, {"error": "Job queue is full; retry later."})
+                return
+            self._send_json(202, job)
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080).")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs processed concurrently (default: 4).")
+    parser.add_argument("--queue-size", type=int, default=100, help="Maximum number of waiting jobs (default: 100).")
+    parser.add_argument("--limit", type=int, default=200, help="Top comments and posts to fetch per user (default: 200).")
+    parser.add_argument("--store", metavar="PATH", help="SQLite content store for incremental refreshes of scraped history.")
+    parser.add_argument("--llm-cache", metavar="PATH", help="SQLite file caching LLM responses across runs.")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_CONTENT_TOKEN_BUDGET,
+                        help=f"Maximum tokens of user content per prompt (default: {DEFAULT_CONTENT_TOKEN_BUDGET}).")
+    parser.add_argument("--reddit-rpm", type=float, default=DEFAULT_REDDIT_RPM,
+                        help=f"Reddit requests per minute shared by all workers (default: {DEFAULT_REDDIT_RPM}).")
+    parser.add_argument("--openai-rpm", type=float, default=DEFAULT_OPENAI_RPM,
+                        help=f"OpenAI requests per minute shared by all workers (default: {DEFAULT_OPENAI_RPM}).")
+    parser.add_argument("--openai-tpm", type=float, default=DEFAULT_OPENAI_TPM,
+                        help=f"OpenAI tokens per minute shared by all workers (default: {DEFAULT_OPENAI_TPM}).")
+    parser.add_argument("--output-dir", default=".", help="Directory for persona files (default: current directory).")
+    parser.add_argument("--shard-output", action="store_true",
+                        help="Spread persona files over hash-sharded subdirectories of the output directory.")
+    parser.add_argument("--archive", metavar="PATH",
+                        help="Also append every persona to an archive: gzipped JSON lines (.jsonl.gz) or SQLite (.db).")
+    args = parser.parse_args()
+
+    credentials = load_credentials()
+    if not credentials:
+        print("Error: Missing one or more environment variables.")
+        print("Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, and OPENAI_API_KEY are set in your .env file.")
+        sys.exit(1)
+
+    set_scheduler(RateLimitScheduler(reddit_rpm=args.reddit_rpm, openai_rpm=args.openai_rpm,
+                                     openai_tpm=args.openai_tpm))
+    reddit = init_reddit_api(credentials["REDDIT_CLIENT_ID"], credentials["REDDIT_CLIENT_SECRET"],
+                             credentials["REDDIT_USER_AGENT"])
+    service = PersonaService(reddit, make_client(credentials["OPENAI_API_KEY"]), workers=args.workers,
+                             queue_size=args.queue_size, output_dir=args.output_dir, limit=args.limit,
+                             store=ContentStore(args.store) if args.store else None,
+                             cache=ResponseCache(args.llm_cache) if args.llm_cache else None,
+                             token_budget=args.token_budget,
+                             sink=OutputSink(args.output_dir, shard=args.shard_output, archive=args.archive))
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Persona service listening on http://{args.host}:{server.server_address[1]} with {args.workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down; waiting for running jobs to finish...")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
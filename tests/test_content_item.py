@@ -0,0 +1,77 @@
+"""
+Tests for content_item.ContentBatch: items must come back exactly as they were appended.
+
+Run with: python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_item import ContentItem, ContentBatch
+
+ITEMS = [
+    ContentItem(type="comment", id="c1", text="I really enjoy playing Elden Ring.",
+                url="https://reddit.com/r/a/comments/1", subreddit="Eldenring", score=12,
+                created_utc=1700000000.123456),
+    ContentItem(type="post", id="p1", title="Looking for sci-fi books", text="",
+                url="https://reddit.com/r/b/comments/2", subreddit="scifi", score=-3, created_utc=None,
+                urls=("https://reddit.com/r/b/comments/2", "https://reddit.com/r/c/comments/3")),
+    ContentItem(type="comment", id="c2", text="", url="", subreddit=None, score=0, created_utc=0.0),
+    ContentItem(type="comment", id="c3", text="Ünïcödé, emoji 🎮 and a lone surrogate \ud800",
+                url="https://reddit.com/r/a/x", subreddit="Eldenring", score=2**40, created_utc=1.5,
+                urls=("https://reddit.com/r/a/x",)),
+    ContentItem(type="post", id="p2", title="Multi\nline title", text="Body\n\nwith blank lines", url="u",
+                subreddit="scifi"),
+]
+
+def test_round_trip():
+    batch = ContentBatch(ITEMS)
+
+    assert len(batch) == len(ITEMS)
+    assert batch.to_items() == ITEMS
+    assert list(batch) == ITEMS
+    assert batch[1].created_utc is None
+    assert batch[1].urls == ITEMS[1].urls
+    assert batch[2].subreddit is None
+
+def test_indexing():
+    batch = ContentBatch(ITEMS)
+
+    assert batch[-1] == ITEMS[-1]
+    assert batch[0] == ITEMS[0]
+    with pytest.raises(IndexError):
+        batch[len(ITEMS)]
+    with pytest.raises(IndexError):
+        batch[-len(ITEMS) - 1]
+    assert ContentBatch().to_items() == []
+
+def test_items_are_copies():
+    batch = ContentBatch(ITEMS)
+
+    item = batch[0]
+    item.text = "changed"
+    assert batch[0] == ITEMS[0]
+
+def test_append_and_extend_match_constructor():
+    batch = ContentBatch()
+    batch.append(ITEMS[0])
+    batch.extend(ITEMS[1:])
+
+    assert batch.to_items() == ContentBatch(ITEMS).to_items()
+
+def test_random_round_trip_is_smaller_than_items():
+    rng = random.Random(3)
+    items = [ContentItem(type=rng.choice(["comment", "post"]), id=f"{n:x}",
+                         text=" ".join(rng.choices(["a", "bb", "ccc"], k=50)),
+                         url=f"https://reddit.com/r/s{n % 7}/comments/{n:x}", subreddit=f"s{n % 7}",
+                         score=rng.randint(-100, 10_000), created_utc=rng.choice([None, rng.uniform(0, 2e9)]))
+             for n in range(2000)]
+
+    batch = ContentBatch(items)
+
+    assert batch.to_items() == items
+    assert batch.nbytes() < sum(len(item.text) + len(item.url) + 100 for item in items)
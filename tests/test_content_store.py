@@ -0,0 +1,64 @@
+"""
+Tests for content_store: storing items and incremental refreshes against benchmarks/fakes.FakeReddit.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from content_store import ContentStore, refresh_user_content
+from fakes import FakeReddit
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore(str(tmp_path / "content_store.db"))
+    yield store
+    store.close()
+
+def count_stored(store: ContentStore, username: str) -> int:
+    comments, posts = store.get_user_content(username, limit=10_000)
+    return len(comments) + len(posts)
+
+def test_first_refresh_fetches_top_items(store):
+    reddit = FakeReddit(items_per_user=50, page_latency=0)
+
+    comments, posts = refresh_user_content(reddit, store, "alice_one", limit=10)
+
+    assert len(comments) == 10 and len(posts) == 10
+    assert [item.score for item in comments] == sorted((item.score for item in comments), reverse=True)
+    assert store.last_refresh("Alice_One") is not None
+
+def test_incremental_refresh_is_not_cut_short(store):
+    reddit = FakeReddit(items_per_user=300, body_chars=300, page_latency=0)
+    year_ago = time.time() - 365 * 86400
+    store.save_items("alice_one", [], year_ago)
+    redditor = reddit.redditor("alice_one")
+    in_window = sum(1 for listing in (redditor.comments, redditor.submissions)
+                    for item in listing._items() if item.created_utc >= year_ago)
+
+    # Neither the character budget nor the limit may stop the page-through early, since the
+    # refresh time moves forward and skipped items would never be fetched again
+    comments, posts = refresh_user_content(reddit, store, "alice_one", limit=20, max_chars=5000)
+
+    assert len(comments) <= 20 and len(posts) <= 20
+    assert count_stored(store, "alice_one") == in_window
+    assert store.last_refresh("alice_one") > year_ago
+
+    refresh_user_content(reddit, store, "alice_one", limit=20, max_chars=5000)
+    assert count_stored(store, "alice_one") == in_window
+
+def test_refresh_error_keeps_refresh_time(store):
+    reddit = FakeReddit(items_per_user=20, page_latency=0, missing_users=("ghost_user",))
+    store.save_items("ghost_user", [], 1000.0)
+
+    with pytest.raises(Exception):
+        refresh_user_content(reddit, store, "ghost_user", raise_on_error=True)
+    assert refresh_user_content(reddit, store, "ghost_user") == ([], [])
+    assert store.last_refresh("ghost_user") == 1000.0
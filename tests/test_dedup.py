@@ -0,0 +1,107 @@
+"""
+Tests for dedup: MinHash signatures and the grouping of exact and near-duplicate items.
+
+Run with: python -m pytest tests
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_item import ContentItem
+from dedup import (NUM_BINS, SHINGLE_WORDS, dedup_items, estimate_similarity, minhash_signature,
+                   normalize_words)
+
+LONG_TEXT = ("Honestly I think the new update really works for me but my job keeps me busy "
+             "so weekends are for games and nothing else")
+
+def comment(item_id: str, text: str, score: int = 0, created_utc: float | None = None) -> ContentItem:
+    return ContentItem(type="comment", id=item_id, text=text, url=f"https://reddit.com/r/x/comments/{item_id}",
+                       score=score, created_utc=created_utc)
+
+def shingles(words: list) -> set:
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def test_signature_is_deterministic_and_dense():
+    words = normalize_words(LONG_TEXT)
+
+    signature = minhash_signature(words)
+
+    assert len(signature) == NUM_BINS
+    assert signature == minhash_signature(list(words))
+    assert estimate_similarity(signature, minhash_signature(words)) == 1.0
+    # A text shorter than one shingle still fills every bin by borrowing
+    assert len(set(minhash_signature(["hi"]))) == NUM_BINS
+
+def test_similarity_estimates_jaccard():
+    rng = random.Random(7)
+    vocabulary = [f"word{n}" for n in range(500)]
+    for _ in range(20):
+        words_a = rng.choices(vocabulary, k=200)
+        words_b = list(words_a)
+        for position in rng.sample(range(200), rng.randint(0, 60)):
+            words_b[position] = rng.choice(vocabulary)
+        shingles_a, shingles_b = shingles(words_a), shingles(words_b)
+        jaccard = len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+        estimate = estimate_similarity(minhash_signature(words_a), minhash_signature(words_b))
+
+        assert abs(estimate - jaccard) < 0.2
+
+def test_exact_duplicates_keep_highest_score_and_all_urls():
+    items = [comment("1", "This is the way.", score=3), comment("2", "other text entirely", score=1),
+             comment("3", "this is THE WAY!!", score=10), comment("4", "This is the way", score=5)]
+
+    kept = dedup_items(items)
+
+    assert [item.id for item in kept] == ["3", "2"]
+    assert kept[0].urls == (items[2].url, items[3].url, items[0].url)
+    assert kept[1].urls == () # Items without duplicates are left untouched
+
+def test_score_ties_go_to_most_recent():
+    items = [comment("1", "same words here", score=2, created_utc=100.0),
+             comment("2", "Same words here.", score=2, created_utc=200.0),
+             comment("3", "same words here", score=2, created_utc=None)]
+
+    kept = dedup_items(items)
+
+    assert [item.id for item in kept] == ["2"]
+    assert kept[0].urls == (items[1].url, items[0].url, items[2].url)
+
+def test_near_duplicates_are_grouped():
+    items = [comment("1", LONG_TEXT, score=1), comment("2", "I just finished Dune and loved it", score=4),
+             comment("3", LONG_TEXT.replace("else", "more"), score=2)]
+
+    kept = dedup_items(items)
+
+    assert [item.id for item in kept] == ["3", "2"] # In order of each group's first occurrence
+    assert kept[0].urls == (items[2].url, items[0].url)
+
+def test_distinct_and_empty_items():
+    items = [comment("1", "first unrelated comment about cooking pasta"), comment("2", ""),
+             comment("3", "second unrelated comment about fixing bikes"), comment("4", "  ")]
+
+    kept = dedup_items(items)
+
+    assert [item.id for item in kept] == ["1", "2", "3"]
+
+def test_posts_compare_title_and_body():
+    post = ContentItem(type="post", id="p1", title="Looking for sci-fi books", text="", url="https://reddit.com/p1")
+    repost = ContentItem(type="post", id="p2", title="Looking for sci-fi books!", text="", url="https://reddit.com/p2",
+                         score=9)
+    other = ContentItem(type="post", id="p3", title="Looking for sci-fi books", text="Just finished Dune.",
+                        url="https://reddit.com/p3")
+
+    kept = dedup_items([post, repost, other])
+
+    assert [item.id for item in kept] == ["p2", "p3"]
+
+def test_urls_of_earlier_merges_are_kept():
+    kept_before = comment("1", "This is the way", score=1)
+    kept_before.urls = (kept_before.url, "https://reddit.com/r/x/comments/old")
+    items = [kept_before, comment("2", "this is the way", score=5)]
+
+    kept = dedup_items(items)
+
+    assert kept[0].urls == (items[1].url, kept_before.url, "https://reddit.com/r/x/comments/old")
@@ -0,0 +1,85 @@
+"""
+Smoke tests running main.main end to end against the offline fakes in benchmarks/fakes.py.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import main
+from fakes import FakeReddit, FakeOpenAIServer
+from instrumentation import Metrics, set_metrics
+from output_sink import OutputSink
+from rate_limiter import set_scheduler
+
+@pytest.fixture
+def run_main(tmp_path, monkeypatch):
+    """
+    Returns a function running main.main with the given arguments, returning its exit code.
+    """
+    reddit = FakeReddit(items_per_user=30, body_chars=120, page_latency=0)
+    server = FakeOpenAIServer(latency=0, completion_tokens=50).start()
+    for name in ["REDDIT_CLIENT_ID", "REDDIT_CLIENT_SECRET", "REDDIT_USER_AGENT", "OPENAI_API_KEY"]:
+        monkeypatch.setenv(name, "offline-test")
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setattr(main, "init_reddit_api", lambda *credentials: reddit)
+    monkeypatch.setattr(main.atexit, "register", lambda *args: None) # The test closes the sinks itself
+    opened = []
+    def open_sink(*args, **kwargs) -> OutputSink:
+        opened.append(OutputSink(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(main, "OutputSink", open_sink)
+
+    def run(*args: str) -> int:
+        monkeypatch.setattr(sys, "argv", ["main.py", *args, "--output-dir", str(tmp_path)])
+        try:
+            main.main()
+        except SystemExit as e:
+            return e.code or 0
+        finally:
+            for sink in opened:
+                sink.close()
+        return 0
+
+    yield run
+    server.stop()
+    set_scheduler(None)
+    set_metrics(Metrics())
+
+def test_single_user(run_main, tmp_path):
+    started = time.time()
+    assert run_main("https://www.reddit.com/user/alice_one/") == 0
+
+    path = tmp_path / "alice_one_persona.txt"
+    with open(path, encoding="utf-8") as f:
+        assert f.read().startswith("### User Persona")
+    # The persona is indexed with the time its scrape started, not the time it was written
+    sink = OutputSink(str(tmp_path))
+    assert started <= sink.lookup("alice_one")["generated_utc"] <= os.path.getmtime(path)
+    sink.close()
+
+def test_single_user_stream_then_update(run_main, tmp_path):
+    assert run_main("https://www.reddit.com/user/alice_one/", "--stream") == 0
+    assert run_main("https://www.reddit.com/user/alice_one/", "--update") == 0
+
+    sink = OutputSink(str(tmp_path))
+    assert sink.load("alice_one") is not None
+    sink.close()
+
+def test_invalid_url(run_main):
+    assert run_main("https://example.com/alice_one") == 1
+
+def test_batch(run_main, tmp_path):
+    batch_file = tmp_path / "users.txt"
+    batch_file.write_text("alice_one\nu/bob_two\n", encoding="utf-8")
+
+    assert run_main("--batch", str(batch_file)) == 0
+    assert os.path.exists(tmp_path / "alice_one_persona.txt")
+    assert os.path.exists(tmp_path / "bob_two_persona.txt")
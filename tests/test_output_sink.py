@@ -0,0 +1,140 @@
+"""
+Tests for output_sink.OutputSink: file layout, the index, the archives and streaming.
+
+Run with: python -m pytest tests
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from output_sink import OutputSink, INDEX_FILENAME, persona_filename, shard_dir
+
+PERSONA = "### User Persona: Some_User\n\nInterests: Gaming (Citations: https://reddit.com/r/gaming/comments/1)\n"
+
+@pytest.fixture
+def make_sink(tmp_path):
+    sinks = []
+    def make(**kwargs):
+        sink = OutputSink(str(tmp_path / "out"), **kwargs)
+        sinks.append(sink)
+        return sink
+    yield make
+    for sink in sinks:
+        sink.close()
+
+@pytest.mark.parametrize("shard", [False, True])
+def test_write_load_locate(make_sink, tmp_path, shard):
+    sink = make_sink(shard=shard)
+    output_dir = str(tmp_path / "out")
+    expected_dir = shard_dir(output_dir, "Some_User") if shard else output_dir
+    expected_path = os.path.join(expected_dir, persona_filename("Some_User"))
+
+    path = sink.write("Some_User", PERSONA).result(timeout=10)
+
+    assert path == expected_path == sink.path_for("Some_User")
+    assert sink.locate("some_user") == path
+    content, generated_utc = sink.load("SOME_USER")
+    assert content == PERSONA
+    assert generated_utc == sink.lookup("Some_User")["generated_utc"]
+    assert sink.load("someone_else") is None
+
+def test_index_entry(make_sink, tmp_path):
+    sink = make_sink(shard=True)
+    path = sink.write("Some_User", PERSONA).result(timeout=10)
+
+    data = PERSONA.encode("utf-8")
+    entry = sink.lookup("Some_User")
+    assert entry["path"] == path
+    assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+    assert entry["bytes"] == len(data)
+    with sqlite3.connect(str(tmp_path / "out" / INDEX_FILENAME)) as conn:
+        rows = conn.execute("SELECT username, path FROM personas").fetchall()
+    assert rows == [("some_user", path)]
+
+def test_generated_time(make_sink):
+    sink = make_sink()
+    sink.write("first_user", PERSONA, generated_utc=1700000000.5).result(timeout=10)
+    sink.stream("second_user", iter([PERSONA]), generated_utc=1700000001.5)
+    sink.flush()
+
+    assert sink.lookup("first_user")["generated_utc"] == 1700000000.5
+    assert sink.load("second_user") == (PERSONA, 1700000001.5)
+
+def test_gzip_archive(make_sink, tmp_path):
+    archive = str(tmp_path / "personas.jsonl.gz")
+    sink = make_sink(archive=archive)
+    sink.write("first_user", "first persona").result(timeout=10)
+    sink.write("second_user", "second persona").result(timeout=10)
+    sink.close()
+
+    with gzip.open(archive, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [(record["username"], record["persona"]) for record in records] == \
+        [("first_user", "first persona"), ("second_user", "second persona")]
+    assert records[0]["sha256"] == hashlib.sha256(b"first persona").hexdigest()
+
+def test_sqlite_archive(make_sink, tmp_path):
+    archive = str(tmp_path / "personas.db")
+    sink = make_sink(archive=archive)
+    sink.write("some_user", "old persona").result(timeout=10)
+    sink.write("some_user", "new persona").result(timeout=10)
+    sink.close()
+
+    with sqlite3.connect(archive) as conn:
+        rows = conn.execute("SELECT username, persona FROM persona_archive ORDER BY id").fetchall()
+    assert rows == [("some_user", "old persona"), ("some_user", "new persona")]
+
+def test_stream_writes_and_indexes(make_sink):
+    sink = make_sink()
+    received = []
+
+    path = sink.stream("Some_User", iter(["### User ", "Persona"]), on_chunk=received.append)
+    sink.flush()
+
+    assert received == ["### User ", "Persona"]
+    assert sink.load("Some_User")[0] == "### User Persona"
+    assert sink.lookup("Some_User")["path"] == path
+    assert not os.path.exists(path + ".part")
+
+def test_stream_failure_keeps_only_part_file(make_sink):
+    sink = make_sink()
+    def chunks():
+        yield "### User Persona: Some_User\n\n"
+        raise RuntimeError("connection dropped")
+
+    assert sink.stream("Some_User", chunks()) is None
+    sink.flush()
+
+    path = sink.path_for("Some_User")
+    assert not os.path.exists(path)
+    with open(path + ".part", encoding="utf-8") as f:
+        assert f.read() == "### User Persona: Some_User\n\n"
+    assert sink.lookup("Some_User") is None
+
+def test_close_flushes_queued_writes(make_sink):
+    sink = make_sink()
+    futures = [sink.write(f"user_{n}", f"persona {n}") for n in range(100)]
+    sink.close()
+
+    assert all(future.done() for future in futures)
+    reopened = make_sink()
+    for n in range(100):
+        assert futures[n].result() == reopened.locate(f"user_{n}")
+        assert reopened.load(f"user_{n}")[0] == f"persona {n}"
+
+def test_write_and_stream_after_close_raise(make_sink):
+    sink = make_sink()
+    sink.close()
+
+    with pytest.raises(RuntimeError):
+        sink.write("some_user", PERSONA)
+    with pytest.raises(RuntimeError):
+        sink.stream("some_user", iter([PERSONA]))
+    assert not os.path.exists(sink.path_for("some_user"))
@@ -0,0 +1,133 @@
+"""
+Tests for rate_limiter: token buckets and the scheduler's retry and pause behaviour.
+
+Errors are prawcore exceptions built on a stand-in response, which classify_error handles
+like the real ones.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import prawcore
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimitScheduler, TokenBucket, classify_error, parse_reset_seconds
+
+def server_error() -> Exception:
+    return prawcore.exceptions.ServerError(SimpleNamespace(status_code=503, headers={}))
+
+def too_many_requests(retry_after: str) -> Exception:
+    return prawcore.exceptions.TooManyRequests(SimpleNamespace(status_code=429, headers={"retry-after": retry_after},
+                                                               text=""))
+
+class FlakyCall:
+    """
+    Fails with the given errors in turn, then returns "ok"; records when each attempt was made.
+    """
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.attempts = []
+
+    def __call__(self) -> str:
+        self.attempts.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+@pytest.fixture
+def scheduler() -> RateLimitScheduler:
+    return RateLimitScheduler(reddit_rpm=6000, openai_rpm=6000, openai_tpm=1e9, max_retries=3,
+                              base_delay=0.01, max_delay=0.05)
+
+def test_classify_error():
+    assert classify_error(server_error()) == (True, None, False)
+    assert classify_error(too_many_requests("2")) == (True, 2.0, True)
+    assert classify_error(ValueError("bad input")) == (False, None, False)
+
+def test_retries_retryable_errors(scheduler):
+    func = FlakyCall(server_error(), server_error())
+
+    assert scheduler.call("reddit", func) == "ok"
+    assert len(func.attempts) == 3
+
+def test_raises_non_retryable_errors_at_once(scheduler):
+    func = FlakyCall(ValueError("bad input"))
+
+    with pytest.raises(ValueError):
+        scheduler.call("reddit", func)
+    assert len(func.attempts) == 1
+
+def test_raises_once_retries_are_exhausted(scheduler):
+    func = FlakyCall(*(server_error() for _ in range(10)))
+
+    with pytest.raises(prawcore.exceptions.ServerError):
+        scheduler.call("reddit", func)
+    assert len(func.attempts) == scheduler.max_retries + 1
+
+def test_rate_limit_pauses_the_whole_service(scheduler):
+    func = FlakyCall(too_many_requests("0.3"))
+
+    assert scheduler.call("reddit", func) == "ok"
+
+    # The retry waited for Retry-After by pausing the bucket, which holds back other calls too
+    assert func.attempts[1] - func.attempts[0] >= 0.29
+    scheduler.buckets["reddit"]["requests"].pause(0.2)
+    start = time.monotonic()
+    scheduler.call("reddit", lambda: None)
+    assert time.monotonic() - start >= 0.19
+    # Other services are unaffected
+    start = time.monotonic()
+    scheduler.call("openai", lambda: None)
+    assert time.monotonic() - start < 0.1
+
+def test_acquire_false_takes_no_token_but_retries_do():
+    scheduler = RateLimitScheduler(reddit_rpm=60, base_delay=0.01, max_delay=0.01)
+    bucket = scheduler.buckets["reddit"]["requests"]
+
+    scheduler.call("reddit", lambda: None, acquire=False)
+    assert bucket.tokens == pytest.approx(60, abs=0.01)
+    scheduler.call("reddit", FlakyCall(server_error()), acquire=False)
+    assert bucket.tokens == pytest.approx(59, abs=0.01)
+
+def test_openai_calls_take_request_and_token_quota(scheduler):
+    scheduler.call("openai", lambda: None, tokens=5000)
+
+    assert scheduler.buckets["openai"]["tokens"].tokens == pytest.approx(1e9 - 5000, abs=100)
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600, capacity=1) # One token every 0.1s
+
+    assert bucket.acquire() == 0
+    start = time.monotonic()
+    waited = bucket.acquire()
+    assert waited == pytest.approx(0.1, abs=0.05)
+    assert time.monotonic() - start >= 0.09
+    # An oversized request is capped to the capacity instead of waiting forever
+    assert bucket.acquire(100) < 0.2
+
+def test_bucket_update_from_headers(scheduler):
+    scheduler.update_from_headers("openai", {"x-ratelimit-remaining-requests": "0",
+                                             "x-ratelimit-reset-requests": "250ms",
+                                             "x-ratelimit-remaining-tokens": "1000"})
+
+    requests, tokens = scheduler.buckets["openai"]["requests"], scheduler.buckets["openai"]["tokens"]
+    assert tokens.tokens <= 1000 + 1
+    assert requests.paused_until - time.monotonic() == pytest.approx(0.25, abs=0.05)
+
+def test_backoff(scheduler):
+    assert all(0 <= scheduler.backoff(attempt) <= scheduler.max_delay for attempt in range(10))
+    assert scheduler.backoff(0, retry_after=2) == 2
+
+def test_parse_reset_seconds():
+    assert parse_reset_seconds("1.5") == 1.5
+    assert parse_reset_seconds("6m0s") == 360
+    assert parse_reset_seconds("20ms") == pytest.approx(0.02)
+    assert parse_reset_seconds("1h2m3s") == 3723
+    assert parse_reset_seconds("") is None
+    assert parse_reset_seconds("soon") is None
@@ -0,0 +1,110 @@
+"""
+Tests for retrieval: BM25 scoring and per-section evidence selection.
+
+Run with: python -m pytest tests
+"""
+import math
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_item import ContentItem
+from prompt_builder import count_tokens
+from retrieval import (BM25_B, BM25_K1, SECTION_QUERIES, BM25Index, build_retrieval_block, document_words,
+                       retrieve_section_evidence)
+
+def reference_bm25(documents: list, query_terms: list) -> dict:
+    """
+    Scores every document for the query with the textbook BM25 formula.
+    """
+    average_length = sum(map(len, documents)) / len(documents)
+    scores = {}
+    for doc_id, terms in enumerate(documents):
+        counts = Counter(terms)
+        score = 0.0
+        for term in set(query_terms):
+            frequency = counts[term]
+            if not frequency:
+                continue
+            containing = sum(1 for other in documents if term in other)
+            idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B + BM25_B * len(terms) / average_length))
+        if score:
+            scores[doc_id] = score
+    return scores
+
+def comment(item_id: str, text: str, score: int = 1) -> ContentItem:
+    return ContentItem(type="comment", id=item_id, text=text, url=f"https://reddit.com/r/x/comments/{item_id}",
+                       score=score, created_utc=1700000000.0)
+
+def test_bm25_matches_reference():
+    rng = random.Random(11)
+    vocabulary = [f"t{n}" for n in range(40)]
+    documents = [rng.choices(vocabulary, k=rng.randint(1, 30)) for _ in range(200)]
+    index = BM25Index(documents)
+    for _ in range(20):
+        query = rng.choices(vocabulary, k=4)
+        expected = reference_bm25(documents, query)
+
+        results = index.search(query, k=len(documents))
+
+        assert dict(results) == pytest.approx(expected)
+        assert [score for _, score in results] == sorted(expected.values(), reverse=True)
+
+def test_search_limits_and_unknown_terms():
+    index = BM25Index([["cat", "dog"], ["cat"], ["bird"]])
+
+    assert [doc_id for doc_id, _ in index.search(["cat"], k=1)] == [1] # The shorter document ranks higher
+    assert index.search(["fish"]) == []
+    assert BM25Index([]).search(["cat"]) == []
+
+def test_document_words_index_titles_once():
+    link_post = ContentItem(type="post", id="1", title="Cool link", text="", url="")
+    prepared_link_post = ContentItem(type="post", id="2", title="Cool link!", text="Cool link", url="")
+    text_post = ContentItem(type="post", id="3", title="Cool link", text="body here", url="")
+
+    assert document_words(link_post) == ["cool", "link"]
+    assert document_words(prepared_link_post) == ["cool", "link"]
+    assert document_words(text_post) == ["cool", "link", "body", "here"]
+    assert document_words(comment("4", "Body here")) == ["body", "here"]
+
+def test_section_evidence():
+    items = [comment("1", "My wife and kids moved to a new city for my job", score=5),
+             comment("2", "I hate how broken and annoying this update is", score=3),
+             comment("3", "Every weekend I usually play games in the morning", score=2),
+             comment("4", "Nice", score=50),
+             comment("5", "I love cooking, it is my passion and so much fun", score=4),
+             comment("6", "Agreed", score=40)]
+
+    evidence = retrieve_section_evidence(items, k=2)
+
+    assert list(evidence) == list(SECTION_QUERIES)
+    assert evidence["Demographics"][0].id == "1"
+    assert evidence["Frustrations"][0].id == "2"
+    assert evidence["Behavior & Habits"][0].id == "3"
+    # Sections without a query take the highest-ranked items nothing else retrieved
+    assert {item.id for item in evidence["Online Behavior"] + evidence["Quote"]} <= {"4", "6"}
+    assert evidence["Online Behavior"]
+    ids = [item.id for section_items in evidence.values() for item in section_items]
+    assert len(ids) == len(set(ids)) # No item is repeated
+    assert all(len(section_items) <= 2 for section_items in evidence.values())
+
+def test_retrieval_block_respects_budget():
+    rng = random.Random(5)
+    words = "love hate work family every day want think weekend job city problem goal fun".split()
+    items = [comment(str(n), " ".join(rng.choices(words, k=60)), score=rng.randint(0, 100)) for n in range(300)]
+
+    block, included = build_retrieval_block(items, k=8, token_budget=2000)
+
+    assert 0 < included <= 8 * len(SECTION_QUERIES)
+    assert block.count("https://reddit.com/r/x/comments/") == included
+    sections = ("\n" + block).split("\n*Evidence for ")[1:]
+    assert len(sections) > 1
+    for section in sections:
+        assert count_tokens("*Evidence for " + section.rstrip("\n") + "\n") <= 2000 // len(SECTION_QUERIES)
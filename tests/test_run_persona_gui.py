@@ -0,0 +1,60 @@
+"""
+Tests for run_persona_gui.PersonaSession against the offline fakes in benchmarks/fakes.py.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from openai import OpenAI
+
+import run_persona_gui
+from fakes import FakeReddit, FakeOpenAIServer
+from output_sink import OutputSink
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # The session writes personas to the working directory
+    with FakeOpenAIServer(latency=0.05, completion_tokens=200, tokens_per_second=2000) as server:
+        session = run_persona_gui.PersonaSession(workers=2)
+        session._clients = (FakeReddit(items_per_user=30, page_latency=0.01),
+                            OpenAI(api_key="offline-test", base_url=server.base_url))
+        yield session
+        session.shutdown()
+
+def drain(session) -> list:
+    events = []
+    while not session.events.empty():
+        events.append(session.events.get_nowait())
+    return events
+
+def test_job_completes(session, tmp_path):
+    job_id = session.submit("alice_one")
+    session._jobs[job_id][0].result(timeout=30)
+
+    final = [message for event_job, message, is_final in drain(session) if event_job == job_id and is_final]
+    assert len(final) == 1 and final[0].startswith("Persona generation complete!")
+    assert session.sink.lookup("alice_one") is not None
+
+def test_shutdown_waits_for_running_jobs(session, tmp_path):
+    job_ids = [session.submit(name) for name in ("alice_one", "bob_two", "carol_three")]
+    session.shutdown()
+
+    # Every job ended before the sink was closed, so none of them wrote into a closed sink
+    assert all(session._jobs[job_id][0].done() for job_id in job_ids)
+    final = {event_job: message for event_job, message, is_final in drain(session) if is_final}
+    assert set(final) == set(job_ids)
+    assert not any("closed" in message for message in final.values())
+    sink = OutputSink(str(tmp_path))
+    for job_id, username in zip(job_ids, ("alice_one", "bob_two", "carol_three")):
+        # A job either finished and was indexed, or was cancelled and left no file behind
+        assert (sink.lookup(username) is not None) == final[job_id].startswith("Persona generation complete!")
+    sink.close()
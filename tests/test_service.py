@@ -0,0 +1,52 @@
+"""
+Tests for service.PersonaService against the offline fakes in benchmarks/fakes.py.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from openai import OpenAI
+
+from fakes import FakeReddit, FakeOpenAIServer
+from service import PersonaService
+
+@pytest.fixture
+def service(tmp_path):
+    with FakeOpenAIServer(latency=0.2, completion_tokens=50) as server:
+        service = PersonaService(FakeReddit(items_per_user=20, page_latency=0.01),
+                                 OpenAI(api_key="offline-test", base_url=server.base_url),
+                                 workers=2, output_dir=str(tmp_path))
+        yield service
+        service.shutdown()
+
+def wait_for(service, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while service.get(job_id)["status"] not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return service.get(job_id)
+
+def test_submit_deduplicates_usernames_case_insensitively(service, tmp_path):
+    first = service.submit("alice_one")
+    second = service.submit("Alice_One")
+
+    assert second["id"] == first["id"]
+    job = wait_for(service, first["id"])
+    assert job["status"] == "done"
+    assert os.listdir(tmp_path).count("alice_one_persona.txt") == 1
+    assert "Alice_One_persona.txt" not in os.listdir(tmp_path)
+
+def test_resubmit_after_finish_starts_new_job(service):
+    first = service.submit("alice_one")
+    assert wait_for(service, first["id"])["status"] == "done"
+    second = service.submit("ALICE_ONE")
+
+    assert second["id"] != first["id"]
+    assert wait_for(service, second["id"])["status"] == "done"
@@ -1,4 +1,50 @@
+import html
+import os
 import re
+import string
+from typing import Iterable, List
+from instrumentation import get_metrics
+from output_sink import atomic_write
+
+# Precompiled patterns and tables shared by the single-text and batch preprocessing functions.
+# Non-alphanumeric characters are removed from the UTF-8 bytes with one C-level bytes.translate:
+# every ASCII symbol and every non-ASCII byte is deleted, after the (few) non-ASCII whitespace
+# characters have been turned into spaces so that they still separate words.
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+_KEEP_BYTES = set((string.ascii_lowercase + string.digits).encode()) | {b for b in range(128) if chr(b).isspace()}
+_SYMBOL_BYTES = bytes(b for b in range(256) if b not in _KEEP_BYTES)
+_UNICODE_SPACES = [chr(c).encode("utf-8") for c in range(128, 0x3001) if chr(c).isspace()]
+# Batch variant: texts are joined with a NUL separator that neither the URL pattern nor the
+# byte deletion removes
+_BATCH_SEPARATOR = "\x00"
+_BATCH_URL_RE = re.compile(r'https?://[^\s\x00]+|www\.[^\s\x00]+')
+_BATCH_SYMBOL_BYTES = _SYMBOL_BYTES.replace(b"\x00", b"")
+# Markdown noise for LLM context: links (rewritten as "label (url)"), heading and quote markers,
+# horizontal rules, bold/underline/strikethrough markers and spoiler tags.
+_MARKDOWN_NOISE_RE = re.compile(
+    r'\[([^\]\n]*)\]\((\S+?)\)'
+    r'|^[ \t]*(?:#{1,6}[ \t]+|>+[ \t]?|(?:[-*_][ \t]*){3,}$)'
+    r'|\*\*|__|~~|>!|!<',
+    re.MULTILINE,
+)
+# Zero-width characters Reddit uses as padding (e.g. "&#x200B;" paragraphs)
+_ZERO_WIDTH_TABLE = str.maketrans("", "", "\u200b\u200c\u200d\ufeff")
+
+def _markdown_replacement(match: re.Match) -> str:
+    if match.group(1) is not None:
+        return f"{match.group(1)} ({match.group(2)})" if match.group(1) else match.group(2)
+    return ""
+
+def _strip_symbols(text: str, symbol_bytes: bytes = _SYMBOL_BYTES) -> str:
+    """
+    Removes every character except lowercase ASCII letters, digits and whitespace.
+    """
+    data = text.encode("utf-8", "surrogatepass")
+    if not text.isascii():
+        for space in _UNICODE_SPACES:
+            if space in data:
+                data = data.replace(space, b" ")
+    return data.translate(None, symbol_bytes).decode("ascii")
 
 def preprocess_text(text: str) -> str:
     """
@@ -12,28 +58,79 @@ def preprocess_text(text: str) -> str:
         return "" # Ensure text is a string
 
     text = text.lower()
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)  # Remove URLs
-    text = re.sub(r'[^a-z0-9\s]', '', text)          # Remove non-alphanumeric except spaces
-    text = re.sub(r'\s+', ' ', text).strip()         # Replace multiple spaces with single, then strip
-    return text
+    if "http" in text or "www." in text:
+        text = _URL_RE.sub('', text)                  # Remove URLs
+    text = _strip_symbols(text)                       # Remove non-alphanumeric except spaces
+    return " ".join(text.split())                     # Replace multiple spaces with single, then strip
 
-def save_persona_to_file(username: str, persona_content: str):
+def clean_for_llm(text: str) -> str:
+    """
+    Cleans text for use as LLM context while keeping its meaning and citations:
+    - Decoding HTML entities (&amp;, &gt;, ...) and dropping zero-width characters.
+    - Stripping Markdown noise (headings, quote markers, rules, bold/strike markers, spoiler tags)
+      and rewriting links as "label (url)".
+    - Collapsing whitespace. Case, URLs and punctuation are kept.
+    """
+    if not isinstance(text, str):
+        return "" # Ensure text is a string
+
+    if "&" in text:
+        text = html.unescape(text)
+    text = _MARKDOWN_NOISE_RE.sub(_markdown_replacement, text.translate(_ZERO_WIDTH_TABLE))
+    return " ".join(text.split())
+
+def preprocess_texts(texts: Iterable[str], keep_context: bool = False) -> List[str]:
+    """
+    Preprocesses a whole list of texts (e.g. every comment of a user) in one call.
+
+    Args:
+        texts (Iterable[str]): The texts to normalize.
+        keep_context (bool): If False, normalize like preprocess_text (lowercase, no URLs or
+                             punctuation). If True, clean like clean_for_llm, keeping URLs and
+                             punctuation for LLM context.
+
+    Returns:
+        List[str]: The processed texts, in input order.
+    """
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    get_metrics().incr("texts_preprocessed", len(texts), keep_context=str(keep_context).lower())
+    if keep_context:
+        return [clean_for_llm(text) for text in texts]
+    joined = _BATCH_SEPARATOR.join(texts)
+    if joined.count(_BATCH_SEPARATOR) != len(texts) - 1:
+        # A text contains the separator itself; fall back to one pass per text
+        return [preprocess_text(text) for text in texts]
+    # Lowercase and strip the whole batch at once, then split it back apart
+    joined = _strip_symbols(_BATCH_URL_RE.sub('', joined.lower()), _BATCH_SYMBOL_BYTES)
+    pieces = joined.split(_BATCH_SEPARATOR)
+    return [" ".join(piece.split()) for piece in pieces] if texts else []
+
+def save_persona_to_file(username: str, persona_content: str, output_dir: str = ".") -> str | None:
     """
     Saves the generated user persona to a text file.
 
+    The file is replaced atomically, so a crash never leaves a half-written persona. Pipelines
+    writing many personas should use output_sink.OutputSink, which also indexes them.
+
     Args:
         username (str): The Reddit username, used for the filename.
         persona_content (str): The complete user persona string.
+        output_dir (str): Directory to write the file into (defaults to the current directory).
+
+    Returns:
+        str | None: The path of the written file, or None if saving failed.
     """
-    filename = f"{username}_persona.txt"
+    filename = os.path.join(output_dir, f"{username}_persona.txt")
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(persona_content)
+        with get_metrics().stage("save_persona", username=username):
+            atomic_write(filename, persona_content)
         print(f"Successfully saved user persona to {filename}")
+        return filename
     except IOError as e:
         print(f"Error saving persona to file {filename}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred while saving file: {e}")
+    return None
 
 if __name__ == "__main__":
     # Example usage for testing utils.py